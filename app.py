@@ -1,86 +1,358 @@
 import os
+import re
 import sys
 import json
+import time
 import queue
+import hashlib
+import shutil
+import sqlite3
+import platform
+import subprocess
 from flask import Flask, render_template, jsonify, request, redirect, url_for, flash, session, abort, send_file, make_response
+from markupsafe import Markup
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from flask_wtf.csrf import CSRFProtect
 from dotenv import load_dotenv
-from models import init_db, get_session, Settings, User, Movie, HolidayChannel, MovieOverride
-from plex_api import PlexAPI
-from scheduler import ScheduleGenerator
+from models import (
+    init_db, get_session, get_db_path, is_volume_properly_mounted, ScopedSession, Settings, User, Movie, Schedule,
+    HolidayChannel, MovieOverride, AppVersion, MovieFavorite, WatchHistory, UserDevice
+)
+from plex_api import PlexAPI, PlexServer
+from tmdb_api import TMDBAPI
+from scheduler import ScheduleGenerator, MovieSnapshot
 from auth import PlexOAuth, create_or_update_plex_user
 from user_management import user_mgmt_bp, validate_invite_code, mark_invite_used
+from theme_service import ThemeService
+from watch_history_service import WatchHistoryService
+from channel_numbers import CHANNEL_NUMBERS, get_channel_meta
+from updater import UpdateManager
 import livetv
 import utils
 import logging
+import threading
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
 from urllib.parse import urlparse, urljoin
 import requests
 from io import BytesIO
-from collections import OrderedDict
+from typing import NamedTuple
+from operator import attrgetter
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import joinedload, load_only, selectinload
 
 load_dotenv()
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Bounded LRU cache for images (max 300 posters ~150MB)
-class BoundedImageCache:
-    def __init__(self, max_size=300):
-        self.cache = OrderedDict()
-        self.max_size = max_size
+class CachedPoster(NamedTuple):
+    """A downloaded poster as kept in the image cache"""
+    data: bytes
+    content_type: str
+    etag: str
+
+class BoundedLRUCache:
+    """LRU cache capped by the total size of its values rather than by entry count"""
+    
+    def __init__(self, max_bytes, sizeof=len, label='entry'):
+        # Plain dicts keep insertion order, so the first key is always the least recently used
+        self.cache = {}
+        self.sizes = {}
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.evictions = 0
+        self.sizeof = sizeof
+        self.label = label
+        # Request threads share the cache; the lock guards reordering and eviction
+        self._lock = threading.Lock()
     
     def get(self, key):
-        if key in self.cache:
-            # Move to end (most recently used)
-            self.cache.move_to_end(key)
-            return self.cache[key]
-        return None
+        with self._lock:
+            # Single lookup on both paths; re-inserting a hit marks it as most recently used
+            value = self.cache.pop(key, None)
+            if value is not None:
+                self.cache[key] = value
+            return value
     
     def set(self, key, value):
-        if key in self.cache:
-            # Update existing and move to end
-            self.cache.move_to_end(key)
-        self.cache[key] = value
-        
-        # Evict oldest if over limit
-        if len(self.cache) > self.max_size:
-            oldest = next(iter(self.cache))
-            logger.info(f"Evicting oldest cached poster: {oldest}")
-            del self.cache[oldest]
+        size = self.sizeof(value)
+        with self._lock:
+            # Drop any existing entry so the new value lands at the end
+            old_size = self.sizes.pop(key, None)
+            if old_size is not None:
+                del self.cache[key]
+                self.current_bytes -= old_size
+            
+            if size > self.max_bytes:
+                logger.warning(f"Not caching {self.label} {key}: {size} bytes exceeds cache budget")
+                return
+            
+            self.cache[key] = value
+            self.sizes[key] = size
+            self.current_bytes += size
+            
+            # Evict oldest until back under the byte budget
+            while self.current_bytes > self.max_bytes:
+                oldest = next(iter(self.cache))
+                # Lazy %-formatting: this runs under the lock on every eviction
+                logger.debug("Evicting oldest cached %s: %s", self.label, oldest)
+                del self.cache[oldest]
+                self.current_bytes -= self.sizes.pop(oldest)
+                self.evictions += 1
+                if self.evictions % 100 == 0:
+                    logger.info("%s cache has evicted %d entries so far", self.label.capitalize(), self.evictions)
+    
+    def discard(self, key):
+        """Drop a cached entry if present (e.g. when its artwork changes)"""
+        with self._lock:
+            if key in self.cache:
+                del self.cache[key]
+                self.current_bytes -= self.sizes.pop(key)
     
     def __contains__(self, key):
-        return key in self.cache
+        with self._lock:
+            return key in self.cache
+
+# Posters range from ~150KB to several MB, so the image cache is capped by bytes
+class BoundedImageCache(BoundedLRUCache):
+    def __init__(self, max_bytes=150 * 1024 * 1024):
+        super().__init__(max_bytes, sizeof=lambda poster: len(poster.data), label='poster')
+        # Keys currently being fetched from Plex, so concurrent misses wait instead of refetching
+        self._inflight = {}
+    
+    def begin_fetch(self, key):
+        """Claim the upstream fetch for key. Returns (is_owner, event); non-owners should wait on event."""
+        with self._lock:
+            event = self._inflight.get(key)
+            if event is not None:
+                return False, event
+            event = threading.Event()
+            self._inflight[key] = event
+            return True, event
+    
+    def end_fetch(self, key):
+        """Release a fetch claimed with begin_fetch and wake any waiting requests"""
+        with self._lock:
+            event = self._inflight.pop(key, None)
+        if event is not None:
+            event.set()
+
+# Poster memory budget in MB (POSTER_CACHE_MB), 150MB by default
+image_cache = BoundedImageCache(max_bytes=int(os.getenv('POSTER_CACHE_MB', '150')) * 1024 * 1024)
+
+# Optional on-disk poster tier. Posters are written to POSTER_CACHE_DIR once downloaded and
+# served from there with send_file instead of from the memory cache; if POSTER_ACCEL_REDIRECT
+# names an nginx internal location mapped to that directory, nginx sends the files itself
+# and Python only returns the redirect header
+POSTER_CACHE_DIR = os.getenv('POSTER_CACHE_DIR')
+POSTER_ACCEL_REDIRECT = os.getenv('POSTER_ACCEL_REDIRECT')
+POSTER_EXTENSIONS = {'image/jpeg': '.jpg', 'image/png': '.png', 'image/webp': '.webp'}
+
+if POSTER_CACHE_DIR:
+    os.makedirs(POSTER_CACHE_DIR, exist_ok=True)
+
+def disk_poster_paths(plex_id):
+    """Candidate on-disk filenames for a poster (none if the disk tier is off or the id isn't filename-safe)"""
+    if not POSTER_CACHE_DIR or not plex_id.isalnum():
+        return []
+    return [f"{plex_id}{ext}" for ext in POSTER_EXTENSIONS.values()]
+
+def find_disk_poster(plex_id):
+    """Return the on-disk poster filename for plex_id, or None"""
+    for filename in disk_poster_paths(plex_id):
+        if os.path.exists(os.path.join(POSTER_CACHE_DIR, filename)):
+            return filename
+    return None
+
+# Bytes read from Plex per chunk while downloading a poster
+POSTER_CHUNK_SIZE = 65536
+
+class PosterDownload:
+    """Collects a poster as it arrives from Plex: straight into a temp file on the disk tier
+    when it is enabled, otherwise into a buffer for the memory cache"""
+    
+    def __init__(self, plex_id, content_type, etag):
+        self.plex_id = plex_id
+        self.content_type = content_type
+        self.etag = etag
+        self.size = 0
+        self.file = None
+        self.buffer = None
+        if disk_poster_paths(plex_id):
+            ext = POSTER_EXTENSIONS.get(content_type.split(';')[0].strip(), '.jpg')
+            self.path = os.path.join(POSTER_CACHE_DIR, f"{plex_id}{ext}")
+            # Write to a temp file and rename so readers (and nginx) never see a partial image
+            self.tmp_path = f"{self.path}.{threading.get_ident()}.tmp"
+            try:
+                self.file = open(self.tmp_path, 'wb')
+            except OSError as e:
+                logger.warning(f"Could not write poster {plex_id} to disk cache: {e}")
+        if self.file is None:
+            self.buffer = bytearray()
+    
+    def write(self, chunk):
+        self.size += len(chunk)
+        if self.buffer is not None:
+            self.buffer.extend(chunk)
+            return
+        try:
+            self.file.write(chunk)
+        except OSError as e:
+            logger.warning(f"Could not write poster {self.plex_id} to disk cache: {e}")
+            self.discard()
+    
+    def finish(self):
+        """Publish a fully downloaded poster to the disk tier or the memory cache"""
+        if self.buffer is not None:
+            image_cache.set(self.plex_id, CachedPoster(bytes(self.buffer), self.content_type, self.etag))
+            self.buffer = None
+            return
+        if self.file is None:
+            return
+        try:
+            self.file.close()
+            os.replace(self.tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Could not write poster {self.plex_id} to disk cache: {e}")
+            self.discard()
+            return
+        self.file = None
+        # Drop a copy saved under another extension before the artwork's format changed
+        for filename in disk_poster_paths(self.plex_id):
+            if filename != os.path.basename(self.path):
+                try:
+                    os.remove(os.path.join(POSTER_CACHE_DIR, filename))
+                except OSError:
+                    pass
+    
+    def discard(self):
+        """Throw away an incomplete download"""
+        self.buffer = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+            try:
+                os.remove(self.tmp_path)
+            except OSError:
+                pass
 
-image_cache = BoundedImageCache(max_size=300)
+def forget_poster(plex_id):
+    """Remove a poster from memory and disk caches so the next request refetches it"""
+    image_cache.discard(plex_id)
+    _failed_posters.pop(plex_id, None)
+    for filename in disk_poster_paths(plex_id):
+        try:
+            os.remove(os.path.join(POSTER_CACHE_DIR, filename))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Could not remove cached poster {filename}: {e}")
 
-def time_to_minutes(time_str):
-    """Convert HH:MM time string to minutes from midnight"""
-    try:
-        hours, minutes = map(int, time_str.split(':'))
-        return hours * 60 + minutes
-    except:
-        return 0
+# Posters Plex failed to return, by plex_id -> retry time. Repeat requests during an outage
+# (or for a broken image) answer 404 at once instead of each waiting on the 10s fetch timeout
+POSTER_FAILURE_TTL = 60  # seconds
+_failed_posters = {}
+
+def poster_recently_failed(plex_id):
+    """True while a failed fetch for plex_id is still inside POSTER_FAILURE_TTL"""
+    retry_at = _failed_posters.get(plex_id)
+    if retry_at is None:
+        return False
+    if retry_at > time.monotonic():
+        return True
+    _failed_posters.pop(plex_id, None)
+    return False
+
+# Posters downloaded ahead of the first guide render after startup (0 disables prefetching),
+# and how many downloads run against Plex at once
+POSTER_PREFETCH_LIMIT = int(os.getenv('POSTER_PREFETCH_LIMIT', '150'))
+POSTER_PREFETCH_WORKERS = int(os.getenv('POSTER_PREFETCH_WORKERS', '16'))
+
+# Keep bulk writes under SQLite's bound-variable limit (999 on older builds)
+SQLITE_MAX_VARIABLES = 450
+
+# Movie columns refreshed from Plex on every sync, diffed as one tuple per row
+MOVIE_SYNC_FIELDS = ('poster_url', 'audience_rating', 'content_rating', 'cast', 'art_url', 'library_name')
+movie_sync_values = attrgetter(*MOVIE_SYNC_FIELDS)
+
+# Most rows written per bulk statement during a sync
+SYNC_BATCH_SIZE = int(os.getenv('POPCORN_SYNC_BATCH', '100'))
+
+def chunked_mappings(mappings):
+    """Yield slices of at most SYNC_BATCH_SIZE mappings that also stay under SQLITE_MAX_VARIABLES"""
+    if not mappings:
+        return
+    columns = max(len(mapping) for mapping in mappings)
+    size = max(min(SYNC_BATCH_SIZE, SQLITE_MAX_VARIABLES // columns), 1)
+    for i in range(0, len(mappings), size):
+        yield mappings[i:i + size]
+
+class Program(NamedTuple):
+    """One guide slot as rendered by guide_channel_row.html"""
+    movie: MovieSnapshot
+    start_time: str
+    end_time: str
+    start_minute: int
+    duration_minutes: int
+    watched: bool
+    is_favorited: bool
+
+# Rendered guide rows by (schedule cache version, day, channel, per-program watched/favorite
+# marks). A row only changes when the schedule is regenerated or those marks change, so repeat
+# guide loads reuse the HTML instead of re-rendering every tile. Watch progress changes
+# constantly, so it is sent to the page separately and never baked into a cached row.
+# Capped by total characters (GUIDE_ROW_CACHE_MB, 16MB by default)
+guide_row_cache = BoundedLRUCache(int(os.getenv('GUIDE_ROW_CACHE_MB', '16')) * 1024 * 1024, label='guide row')
 
 def get_current_minutes():
     """Get current time in minutes from midnight"""
-    now = datetime.now()
-    return now.hour * 60 + now.minute
+    now = time.localtime()
+    return now.tm_hour * 60 + now.tm_min
+
+# Once any user exists the "first user" setup flow is closed for good (admins can't delete
+# their own account, so the last one never goes away). Only that committed, positive probe
+# result is remembered; until then every login/register request probes again
+_app_state = {'users_exist': False}
+
+def has_no_users(db_session):
+    """Return True while no user account exists yet (first-run admin setup)"""
+    if _app_state['users_exist']:
+        return False
+    if db_session.query(User.id).first() is not None:
+        _app_state['users_exist'] = True
+        return False
+    return True
 
 def is_safe_url(target):
     """Validate redirect URL is safe (relative to current host)"""
     if not target:
         return False
-    ref_url = urlparse(request.host_url)
+    # Plain same-site paths need no parsing. "//host" and backslashes are protocol-relative
+    # tricks, and browsers drop tabs/newlines (so "/\t/host" becomes "//host")
+    if target.startswith('/') and not target.startswith('//') and '\\' not in target and target.isprintable():
+        return True
+    # request.host is already the netloc of request.host_url, no need to parse it again
     test_url = urlparse(urljoin(request.host_url, target))
-    return test_url.scheme in ('http', 'https') and ref_url.netloc == test_url.netloc
+    return test_url.scheme in ('http', 'https') and test_url.netloc == request.host
 
 app = Flask(__name__, template_folder='pages')
 
+# Shared Plex sign-in client; it keeps no per-user state and talks through the pooled http_session
+plex_oauth = PlexOAuth()
+
+# Channel list saved when a user unticks every channel on their profile
+DEFAULT_VISIBLE_CHANNELS = list(CHANNEL_NUMBERS)
+
+# Environment settings read once at import rather than on every request
+IS_PRODUCTION = os.getenv('FLASK_ENV') == 'production'
+ADMIN_SETUP_TOKEN = os.getenv('ADMIN_SETUP_TOKEN')
+
 session_secret = os.getenv('SESSION_SECRET')
 if not session_secret or session_secret == 'dev-secret-key-change-in-production':
-    if os.getenv('FLASK_ENV') == 'production':
+    if IS_PRODUCTION:
         logger.error("CRITICAL: SESSION_SECRET not set in production! Application will not start.")
         sys.exit(1)
     else:
@@ -88,15 +360,20 @@ if not session_secret or session_secret == 'dev-secret-key-change-in-production'
         session_secret = 'dev-secret-key-change-in-production'
 
 app.secret_key = session_secret
-app.config['SESSION_COOKIE_SECURE'] = os.getenv('FLASK_ENV') == 'production'
+app.config['SESSION_COOKIE_SECURE'] = IS_PRODUCTION
 app.config['SESSION_COOKIE_HTTPONLY'] = True
 app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
-app.config['REMEMBER_COOKIE_SECURE'] = os.getenv('FLASK_ENV') == 'production'
+app.config['REMEMBER_COOKIE_SECURE'] = IS_PRODUCTION
 app.config['REMEMBER_COOKIE_HTTPONLY'] = True
 app.config['REMEMBER_COOKIE_SAMESITE'] = 'Lax'
 app.config['REMEMBER_COOKIE_DURATION'] = timedelta(days=365)
 app.config['WTF_CSRF_TIME_LIMIT'] = None
 
+# API responses are read by our own scripts, not people: skip sorting keys and always emit
+# compact JSON (Flask pretty-prints in debug mode otherwise)
+app.json.sort_keys = False
+app.json.compact = True
+
 csrf = CSRFProtect(app)
 
 login_manager = LoginManager()
@@ -108,17 +385,28 @@ app.register_blueprint(user_mgmt_bp)
 
 @login_manager.user_loader
 def load_user(user_id):
-    db_session = get_session()
-    return db_session.query(User).filter_by(id=int(user_id)).first()
+    # Loaded on the request-scoped session shared by the view, released at teardown
+    return ScopedSession().get(User, int(user_id))
+
+@app.teardown_appcontext
+def remove_scoped_session(exception=None):
+    ScopedSession.remove()
 
 db_session = None
 plex_api = None
 scheduler = None
+# Set once the background startup sync has finished and schedules are available
+startup_complete = threading.Event()
+
+# Held while a self-update is running
+update_lock = threading.Lock()
+
+# Stored in the database's PRAGMA user_version once run_migrations() has brought it up
+# to date. Bump this whenever desired_columns, the CREATE TABLEs or the indexes change
+CURRENT_SCHEMA_VERSION = 2
 
 def run_migrations():
     """Run database migrations for new columns and tables"""
-    import sqlite3
-    from models import get_db_path
     
     logger.info("Running database migrations...")
     db_path = get_db_path()
@@ -126,195 +414,207 @@ def run_migrations():
     conn = sqlite3.connect(db_path)
     cursor = conn.cursor()
     
-    # Add channel numbers to settings table if it doesn't exist
-    try:
-        cursor.execute("ALTER TABLE settings ADD COLUMN enable_channel_numbers BOOLEAN DEFAULT 1")
-        logger.info("Added column: enable_channel_numbers to settings")
-    except sqlite3.OperationalError as e:
-        if "duplicate column name" in str(e).lower() or "no such table" in str(e).lower():
-            pass
-        else:
-            logger.warning(f"Error adding enable_channel_numbers: {e}")
-    
-    # Add brightness control to settings table if it doesn't exist
-    try:
-        cursor.execute("ALTER TABLE settings ADD COLUMN current_glow_brightness INTEGER DEFAULT 100")
-        logger.info("Added column: current_glow_brightness to settings")
-    except sqlite3.OperationalError as e:
-        if "duplicate column name" in str(e).lower() or "no such table" in str(e).lower():
-            pass
-        else:
-            logger.warning(f"Error adding current_glow_brightness: {e}")
-    
-    # Add TMDB API key to settings table if it doesn't exist
-    try:
-        cursor.execute("ALTER TABLE settings ADD COLUMN tmdb_api_key VARCHAR")
-        logger.info("Added column: tmdb_api_key to settings")
-    except sqlite3.OperationalError as e:
-        if "duplicate column name" in str(e).lower() or "no such table" in str(e).lower():
-            pass
-        else:
-            logger.warning(f"Error adding tmdb_api_key: {e}")
-    
-    # Add selected movie libraries to settings table if it doesn't exist
-    try:
-        cursor.execute("ALTER TABLE settings ADD COLUMN selected_movie_libraries TEXT")
-        logger.info("Added column: selected_movie_libraries to settings")
-    except sqlite3.OperationalError as e:
-        if "duplicate column name" in str(e).lower() or "no such table" in str(e).lower():
-            pass
-        else:
-            logger.warning(f"Error adding selected_movie_libraries: {e}")
-    
-    # Add Plex machine identifier to settings table if it doesn't exist
-    try:
-        cursor.execute("ALTER TABLE settings ADD COLUMN plex_machine_identifier VARCHAR")
-        logger.info("Added column: plex_machine_identifier to settings")
-    except sqlite3.OperationalError as e:
-        if "duplicate column name" in str(e).lower() or "no such table" in str(e).lower():
-            pass
-        else:
-            logger.warning(f"Error adding plex_machine_identifier: {e}")
+    cursor.execute("PRAGMA user_version")
+    schema_version = cursor.fetchone()[0]
+    if schema_version >= CURRENT_SCHEMA_VERSION:
+        conn.close()
+        logger.info(f"Database schema is up to date (version {schema_version})")
+        return
     
-    # Add Live TV enabled flag to settings table if it doesn't exist
-    try:
-        cursor.execute("ALTER TABLE settings ADD COLUMN live_tv_enabled BOOLEAN DEFAULT 0")
-        logger.info("Added column: live_tv_enabled to settings")
-    except sqlite3.OperationalError as e:
-        if "duplicate column name" in str(e).lower() or "no such table" in str(e).lower():
-            pass
-        else:
-            logger.warning(f"Error adding live_tv_enabled: {e}")
-    
-    # Add user preference columns to users table if they don't exist
-    user_columns = [
-        ('enable_crt_mode', 'BOOLEAN DEFAULT 0'),
-        ('enable_film_grain', 'BOOLEAN DEFAULT 0'),
-        ('playback_mode', 'VARCHAR DEFAULT "web_player"'),
-        ('enable_time_offset', 'BOOLEAN DEFAULT 1'),
-        ('visible_channels', 'TEXT'),
-        ('plex_client', 'VARCHAR'),
-        ('current_glow_brightness', 'INTEGER DEFAULT 100'),
-        ('using_default_password', 'BOOLEAN DEFAULT 0')
-    ]
+    # WAL + NORMAL sync must be set outside a transaction; then run all DDL
+    # in a single transaction so startup pays for one fsync instead of one per statement
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    
+    # Columns added since each table was first released, as (name, declaration)
+    desired_columns = {
+        'settings': [
+            ('enable_channel_numbers', 'BOOLEAN DEFAULT 1'),
+            ('current_glow_brightness', 'INTEGER DEFAULT 100'),
+            ('tmdb_api_key', 'VARCHAR'),
+            ('selected_movie_libraries', 'TEXT'),
+            ('plex_machine_identifier', 'VARCHAR'),
+            ('live_tv_enabled', 'BOOLEAN DEFAULT 0')
+        ],
+        'users': [
+            ('enable_crt_mode', 'BOOLEAN DEFAULT 0'),
+            ('enable_film_grain', 'BOOLEAN DEFAULT 0'),
+            ('playback_mode', 'VARCHAR DEFAULT "web_player"'),
+            ('enable_time_offset', 'BOOLEAN DEFAULT 1'),
+            ('visible_channels', 'TEXT'),
+            ('plex_client', 'VARCHAR'),
+            ('current_glow_brightness', 'INTEGER DEFAULT 100'),
+            ('using_default_password', 'BOOLEAN DEFAULT 0')
+        ],
+        'movies': [
+            ('audience_rating', 'REAL'),
+            ('content_rating', 'VARCHAR'),
+            ('cast', 'VARCHAR'),
+            ('art_url', 'VARCHAR'),
+            ('library_name', 'VARCHAR')
+        ],
+        # Precomputed guide layout for each schedule slot
+        'schedules': [
+            ('start_minute', 'INTEGER'),
+            ('duration_minutes', 'INTEGER')
+        ],
+        'watch_history': [
+            ('playback_position', 'INTEGER DEFAULT 0')
+        ],
+        'holiday_channels': [
+            ('genre_filter', 'TEXT'),
+            ('filter_mode', 'TEXT DEFAULT "AND"'),
+            ('tmdb_collection_ids', 'TEXT'),
+            ('tmdb_keywords', 'TEXT'),
+            ('min_rating', 'REAL'),
+            ('min_popularity', 'REAL')
+        ]
+    }
     
-    for column_name, column_def in user_columns:
-        try:
-            cursor.execute(f"ALTER TABLE users ADD COLUMN {column_name} {column_def}")
-            logger.info(f"Added user column: {column_name}")
-        except sqlite3.OperationalError as e:
-            if "duplicate column name" in str(e).lower() or "no such table" in str(e).lower():
-                pass
-            else:
-                logger.warning(f"Error adding user {column_name}: {e}")
-    
-    # Add movie metadata columns
-    movie_columns = [
-        ('audience_rating', 'REAL'),
-        ('content_rating', 'VARCHAR'),
-        ('cast', 'VARCHAR'),
-        ('art_url', 'VARCHAR'),
-        ('library_name', 'VARCHAR')
+    # Indexes for the hot guide/watch-history lookups. users and movies are already
+    # indexed by their UNIQUE constraints; tables not created yet get these from init_db()
+    table_indexes = [
+        ('ix_schedules_channel_day', 'schedules', 'channel, day, start_time'),
+        ('ix_watch_history_user_plex', 'watch_history', 'user_id, plex_id')
     ]
     
-    for column_name, column_def in movie_columns:
-        try:
-            cursor.execute(f"ALTER TABLE movies ADD COLUMN {column_name} {column_def}")
-            logger.info(f"Added movie column: {column_name}")
-        except sqlite3.OperationalError as e:
-            if "duplicate column name" in str(e).lower() or "no such table" in str(e).lower():
-                pass
-            else:
-                logger.warning(f"Error adding movie {column_name}: {e}")
-    
-    # Create watch_history table if not exists
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS watch_history (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER NOT NULL,
-        movie_id INTEGER,
-        plex_id VARCHAR NOT NULL,
-        movie_title VARCHAR NOT NULL,
-        movie_genre VARCHAR,
-        watched_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP NOT NULL,
-        duration_watched INTEGER,
-        playback_position INTEGER DEFAULT 0,
-        FOREIGN KEY (user_id) REFERENCES users(id),
-        FOREIGN KEY (movie_id) REFERENCES movies(id)
-    )
-    ''')
+    # Tables created outright by this pass (already at their current shape)
+    created_tables = ('watch_history', 'channel_favorites', 'movie_favorites')
     
-    # Add playback_position to existing watch_history table
     try:
-        cursor.execute("ALTER TABLE watch_history ADD COLUMN playback_position INTEGER DEFAULT 0")
-        logger.info("Added column: playback_position to watch_history")
-    except sqlite3.OperationalError as e:
-        if "duplicate column name" in str(e).lower() or "no such table" in str(e).lower():
-            pass
-        else:
-            logger.warning(f"Error adding playback_position: {e}")
-    
-    # Create channel_favorites table if not exists
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS channel_favorites (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER NOT NULL,
-        channel_name VARCHAR NOT NULL,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (user_id) REFERENCES users(id),
-        UNIQUE(user_id, channel_name)
-    )
-    ''')
-    
-    # Create movie_favorites table if not exists
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS movie_favorites (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER NOT NULL,
-        movie_id INTEGER NOT NULL,
-        plex_id VARCHAR NOT NULL,
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (user_id) REFERENCES users(id),
-        FOREIGN KEY (movie_id) REFERENCES movies(id),
-        UNIQUE(user_id, movie_id)
-    )
-    ''')
+        # Read each table's columns once up front. An empty set means the table doesn't exist
+        # yet; init_db() (or the CREATE TABLEs below) creates it with every column
+        existing_columns = {}
+        for table in desired_columns:
+            cursor.execute(f"PRAGMA table_info({table})")
+            existing_columns[table] = {row[1] for row in cursor.fetchall()}
+        
+        # Collect every statement and run them as one script in a single write transaction
+        statements = ["BEGIN IMMEDIATE;"]
+        
+        # Create watch_history table if not exists
+        statements.append('''
+        CREATE TABLE IF NOT EXISTS watch_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            movie_id INTEGER,
+            plex_id VARCHAR NOT NULL,
+            movie_title VARCHAR NOT NULL,
+            movie_genre VARCHAR,
+            watched_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP NOT NULL,
+            duration_watched INTEGER,
+            playback_position INTEGER DEFAULT 0,
+            FOREIGN KEY (user_id) REFERENCES users(id),
+            FOREIGN KEY (movie_id) REFERENCES movies(id)
+        );
+        ''')
+        
+        # Create channel_favorites table if not exists
+        statements.append('''
+        CREATE TABLE IF NOT EXISTS channel_favorites (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            channel_name VARCHAR NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(id),
+            UNIQUE(user_id, channel_name)
+        );
+        ''')
+        
+        # Create movie_favorites table if not exists
+        statements.append('''
+        CREATE TABLE IF NOT EXISTS movie_favorites (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            movie_id INTEGER NOT NULL,
+            plex_id VARCHAR NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(id),
+            FOREIGN KEY (movie_id) REFERENCES movies(id),
+            UNIQUE(user_id, movie_id)
+        );
+        ''')
+        
+        # Only ALTER for the columns that are actually missing
+        added_columns = {}
+        for table, columns in desired_columns.items():
+            existing = existing_columns[table]
+            if not existing:
+                continue
+            added_columns[table] = missing = [(name, decl) for name, decl in columns if name not in existing]
+            for column_name, column_def in missing:
+                statements.append(f"ALTER TABLE {table} ADD COLUMN {column_name} {column_def};")
+        
+        if added_columns.get('schedules'):
+            # Backfill from the HH:MM strings so existing schedules don't need regenerating
+            statements.append('''
+            UPDATE schedules SET
+                start_minute = CAST(substr(start_time, 1, 2) AS INTEGER) * 60 + CAST(substr(start_time, 4, 2) AS INTEGER),
+                duration_minutes = (
+                    CAST(substr(end_time, 1, 2) AS INTEGER) * 60 + CAST(substr(end_time, 4, 2) AS INTEGER)
+                    - CAST(substr(start_time, 1, 2) AS INTEGER) * 60 - CAST(substr(start_time, 4, 2) AS INTEGER)
+                    + 1440
+                ) % 1440;
+            ''')
+        
+        if ('filter_mode', 'TEXT DEFAULT "AND"') in added_columns.get('holiday_channels', []):
+            statements.append('UPDATE holiday_channels SET filter_mode = "AND" WHERE filter_mode IS NULL;')
+        
+        for index_name, table, columns in table_indexes:
+            if existing_columns[table] or table in created_tables:
+                statements.append(f"CREATE INDEX IF NOT EXISTS {index_name} ON {table} ({columns});")
+        
+        statements.append(f"PRAGMA user_version = {CURRENT_SCHEMA_VERSION};")
+        statements.append("COMMIT;")
+        cursor.executescript("\n".join(statements))
+        
+        for table, columns in added_columns.items():
+            for column_name, _ in columns:
+                logger.info(f"Added {table} column: {column_name}")
+        if added_columns.get('schedules'):
+            logger.info("Backfilled schedule start_minute/duration_minutes")
+    except Exception as e:
+        conn.rollback()
+        logger.error(f"Database migration failed, changes rolled back: {e}", exc_info=True)
+        raise
+    finally:
+        conn.close()
     
-    conn.commit()
-    conn.close()
     logger.info("Database migrations complete")
 
 def create_default_accounts():
     """Create default demo accounts for first-time users"""
     db_session = get_session()
-    
-    # Create admin account if it doesn't exist
-    admin_user = db_session.query(User).filter_by(username='admin').first()
-    if not admin_user:
-        admin_user = User(
-            username='admin',
-            email='admin@popcorn.local',
-            is_admin=True,
-            using_default_password=True
-        )
-        admin_user.set_password('admin')
-        db_session.add(admin_user)
-        logger.info("Created default admin account (username: admin, password: admin)")
-    
-    # Create demo account if it doesn't exist
-    demo_user = db_session.query(User).filter_by(username='demo').first()
-    if not demo_user:
-        demo_user = User(
-            username='demo',
-            email='demo@popcorn.local',
-            is_admin=False,
-            using_default_password=True
-        )
-        demo_user.set_password('demo')
-        db_session.add(demo_user)
-        logger.info("Created default demo account (username: demo, password: demo)")
-    
-    db_session.commit()
+    try:
+        # Create admin account if it doesn't exist
+        admin_user = db_session.query(User).filter_by(username='admin').first()
+        if not admin_user:
+            admin_user = User(
+                username='admin',
+                email='admin@popcorn.local',
+                is_admin=True,
+                using_default_password=True
+            )
+            admin_user.set_password('admin')
+            db_session.add(admin_user)
+            logger.info("Created default admin account (username: admin, password: admin)")
+        
+        # Create demo account if it doesn't exist
+        demo_user = db_session.query(User).filter_by(username='demo').first()
+        if not demo_user:
+            demo_user = User(
+                username='demo',
+                email='demo@popcorn.local',
+                is_admin=False,
+                using_default_password=True
+            )
+            demo_user.set_password('demo')
+            db_session.add(demo_user)
+            logger.info("Created default demo account (username: demo, password: demo)")
+        
+        db_session.commit()
+    finally:
+        db_session.close()
 
 def initialize_app():
     global db_session, plex_api, scheduler
@@ -322,7 +622,6 @@ def initialize_app():
     logger.info("Initializing Popcorn app...")
     
     # Check if data volume is properly mounted
-    from models import is_volume_properly_mounted
     is_mounted, warning_msg = is_volume_properly_mounted()
     app.config['VOLUME_MOUNTED'] = is_mounted
     app.config['VOLUME_WARNING'] = warning_msg
@@ -401,8 +700,25 @@ def initialize_app():
     scheduler = ScheduleGenerator()
     logger.info("Scheduler initialized")
     
-    sync_movies()
-    scheduler.generate_all_schedules(force=True)
+    # Sync and schedule generation can take minutes on large libraries; don't hold up the server
+    threading.Thread(target=run_startup_sync, daemon=True).start()
+
+def run_startup_sync():
+    """Sync movies from Plex and build schedules, then mark the app ready"""
+    try:
+        sync_movies()
+        scheduler.generate_all_schedules(force=True)
+    except Exception as e:
+        logger.error(f"Startup sync failed: {e}", exc_info=True)
+    finally:
+        startup_complete.set()
+        logger.info("Startup sync complete")
+    
+    if plex_api and POSTER_PREFETCH_LIMIT > 0:
+        try:
+            prefetch_todays_posters()
+        except Exception as e:
+            logger.warning(f"Poster prefetch failed: {e}")
 
 def sync_movies():
     if not plex_api:
@@ -412,89 +728,99 @@ def sync_movies():
     logger.info("Syncing movies from Plex...")
     
     # Get selected libraries from settings
-    from models import Movie
     session = get_session()
-    settings = session.query(Settings).first()
-    
-    selected_libraries = None
-    auto_selected = False
-    if settings and settings.selected_movie_libraries:
-        # Parse comma-separated library names
-        selected_libraries = [lib.strip() for lib in settings.selected_movie_libraries.split(',') if lib.strip()]
-        logger.info(f"Syncing from selected libraries: {selected_libraries}")
-    else:
-        logger.info("No library filter set, syncing from all movie libraries")
-        auto_selected = True
-    
-    # Fetch movies with library filter
-    movie_data = plex_api.fetch_movies(selected_libraries=selected_libraries)
-    
-    # Auto-save library selection on first sync
-    if auto_selected and settings:
-        try:
-            available_libraries = plex_api.get_movie_libraries()
-            if available_libraries:
-                settings.selected_movie_libraries = ','.join(available_libraries)
-                session.commit()
-                logger.info(f"Auto-selected all {len(available_libraries)} movie libraries on first sync: {available_libraries}")
-        except Exception as e:
-            logger.error(f"Error auto-selecting libraries: {e}")
-    
-    existing_combinations = {(m.plex_id, m.genre) for m in session.query(Movie).all()}
-    
-    new_count = 0
-    update_count = 0
-    for data in movie_data:
-        if data['duration'] <= 0:
-            logger.warning(f"Skipping movie '{data['title']}' with invalid duration: {data['duration']}")
-            continue
-            
-        for genre in data['genres']:
-            if (data['plex_id'], genre) not in existing_combinations:
-                movie = Movie(
-                    title=data['title'],
-                    genre=genre,
-                    duration=max(data['duration'], 1),
-                    plex_id=data['plex_id'],
-                    year=data['year'],
-                    rating=data['rating'],
-                    content_rating=data.get('content_rating'),
-                    audience_rating=data.get('audience_rating'),
-                    summary=data['summary'],
-                    poster_url=data.get('poster_url'),
-                    art_url=data.get('art_url'),
-                    cast=data.get('cast'),
-                    library_name=data.get('library_name')
-                )
-                session.add(movie)
-                new_count += 1
-            else:
-                existing_movie = session.query(Movie).filter_by(plex_id=data['plex_id'], genre=genre).first()
-                if existing_movie:
-                    changed = False
-                    if existing_movie.poster_url != data.get('poster_url'):
-                        existing_movie.poster_url = data.get('poster_url')
-                        changed = True
-                    if existing_movie.audience_rating != data.get('audience_rating'):
-                        existing_movie.audience_rating = data.get('audience_rating')
-                        changed = True
-                    if existing_movie.content_rating != data.get('content_rating'):
-                        existing_movie.content_rating = data.get('content_rating')
-                        changed = True
-                    if existing_movie.cast != data.get('cast'):
-                        existing_movie.cast = data.get('cast')
-                        changed = True
-                    if existing_movie.art_url != data.get('art_url'):
-                        existing_movie.art_url = data.get('art_url')
-                        changed = True
-                    if existing_movie.library_name != data.get('library_name'):
-                        existing_movie.library_name = data.get('library_name')
-                        changed = True
-                    if changed:
-                        update_count += 1
-    
-    session.commit()
-    logger.info(f"Added {new_count} new movie entries to database")
+    try:
+        settings = session.query(Settings).first()
+        
+        selected_libraries = None
+        auto_selected = False
+        if settings and settings.selected_movie_libraries:
+            # Parse comma-separated library names
+            selected_libraries = [lib.strip() for lib in settings.selected_movie_libraries.split(',') if lib.strip()]
+            logger.info(f"Syncing from selected libraries: {selected_libraries}")
+        else:
+            logger.info("No library filter set, syncing from all movie libraries")
+            auto_selected = True
+        
+        # Fetch movies with library filter
+        movie_data = plex_api.fetch_movies(selected_libraries=selected_libraries)
+        
+        # Auto-save library selection on first sync
+        if auto_selected and settings:
+            try:
+                available_libraries = plex_api.get_movie_libraries()
+                if available_libraries:
+                    settings.selected_movie_libraries = ','.join(available_libraries)
+                    session.commit()
+                    logger.info(f"Auto-selected all {len(available_libraries)} movie libraries on first sync: {available_libraries}")
+            except Exception as e:
+                logger.error(f"Error auto-selecting libraries: {e}")
+        
+        # Load only the columns needed to diff against Plex, keyed by (plex_id, genre)
+        existing_movies = {
+            (row.plex_id, row.genre): row
+            for row in session.query(
+                Movie.id, Movie.plex_id, Movie.genre, *(getattr(Movie, field) for field in MOVIE_SYNC_FIELDS)
+            ).all()
+        }
+        
+        inserts = []
+        updates = []
+        # A movie can come back more than once (e.g. from several libraries); handle each
+        # (plex_id, genre) once so the bulk insert can't trip the unique constraint
+        seen = set()
+        for data in movie_data:
+            if data['duration'] <= 0:
+                logger.warning(f"Skipping movie '{data['title']}' with invalid duration: {data['duration']}")
+                continue
+                
+            for genre in data['genres']:
+                key = (data['plex_id'], genre)
+                if key in seen:
+                    continue
+                seen.add(key)
+                
+                existing_movie = existing_movies.get(key)
+                if existing_movie is None:
+                    inserts.append({
+                        'title': data['title'],
+                        'genre': genre,
+                        'duration': max(data['duration'], 1),
+                        'plex_id': data['plex_id'],
+                        'year': data['year'],
+                        'rating': data['rating'],
+                        'content_rating': data.get('content_rating'),
+                        'audience_rating': data.get('audience_rating'),
+                        'summary': data['summary'],
+                        'poster_url': data.get('poster_url'),
+                        'art_url': data.get('art_url'),
+                        'cast': data.get('cast'),
+                        'library_name': data.get('library_name')
+                    })
+                else:
+                    new_values = tuple(data.get(field) for field in MOVIE_SYNC_FIELDS)
+                    if new_values != movie_sync_values(existing_movie):
+                        update = dict(zip(MOVIE_SYNC_FIELDS, new_values))
+                        if update['poster_url'] != existing_movie.poster_url or update['art_url'] != existing_movie.art_url:
+                            # Artwork changed; drop the cached copy so it's fetched fresh
+                            forget_poster(data['plex_id'])
+                        update['id'] = existing_movie.id
+                        updates.append(update)
+        
+        for batch in chunked_mappings(inserts):
+            session.bulk_insert_mappings(Movie, batch)
+        for batch in chunked_mappings(updates):
+            session.bulk_update_mappings(Movie, batch)
+        session.commit()
+        logger.info(f"Added {len(inserts)} new movie entries to database, updated {len(updates)}")
+    finally:
+        session.close()
+
+@app.route('/healthz')
+def healthz():
+    """Liveness/readiness probe: 503 until the startup sync has finished"""
+    ready = startup_complete.is_set()
+    return jsonify({'ready': ready}), 200 if ready else 503
 
 @app.route('/login', methods=['GET', 'POST'])
 def login():
@@ -505,10 +831,13 @@ def login():
         username = request.form.get('username')
         password = request.form.get('password')
         
-        db_session = get_session()
+        db_session = ScopedSession()
         user = db_session.query(User).filter_by(username=username).first()
         
         if user and user.check_password(password):
+            # Move the stored hash to the configured method while we have the plaintext
+            if user.password_needs_rehash():
+                user.set_password(password)
             user.last_login = datetime.utcnow()
             db_session.commit()
             login_user(user, remember=True)
@@ -541,13 +870,13 @@ def register():
             flash('Passwords do not match', 'error')
             return render_template('login.html', show_register=True, invite_code=invite_code)
         
-        db_session = get_session()
+        db_session = ScopedSession()
         
-        is_first_user = db_session.query(User).count() == 0
+        is_first_user = has_no_users(db_session)
         invited_by_user_id = None
         
         if is_first_user:
-            required_token = os.getenv('ADMIN_SETUP_TOKEN')
+            required_token = ADMIN_SETUP_TOKEN
             if not required_token:
                 flash('Admin setup is not configured. Please contact the administrator.', 'error')
                 return render_template('login.html', show_register=True)
@@ -594,17 +923,17 @@ def register():
         flash('Account created successfully!', 'success')
         return redirect(url_for('guide'))
     
-    db_session = get_session()
-    is_first_user = db_session.query(User).count() == 0
+    db_session = ScopedSession()
+    is_first_user = has_no_users(db_session)
     return render_template('login.html', show_register=True, is_first_user=is_first_user, invite_code=invite_code)
 
 @app.route('/auth/plex')
 def plex_auth():
-    db_session = get_session()
-    is_first_user = db_session.query(User).count() == 0
+    db_session = ScopedSession()
+    is_first_user = has_no_users(db_session)
     
     if is_first_user:
-        required_token = os.getenv('ADMIN_SETUP_TOKEN')
+        required_token = ADMIN_SETUP_TOKEN
         if not required_token:
             flash('Admin setup is not configured. Please register a local account first.', 'error')
             return redirect(url_for('login'))
@@ -612,7 +941,6 @@ def plex_auth():
         flash('The first admin account must be created using local registration with the setup token.', 'info')
         return redirect(url_for('register'))
     
-    plex_oauth = PlexOAuth()
     redirect_uri = url_for('plex_callback', _external=True)
     
     auth_data = plex_oauth.get_auth_url(redirect_uri)
@@ -631,7 +959,6 @@ def plex_auth():
 @app.route('/auth/plex/check/<pin_id>')
 @csrf.exempt
 def check_plex_pin(pin_id):
-    plex_oauth = PlexOAuth()
     auth_token = plex_oauth.check_pin(pin_id)
     
     if not auth_token:
@@ -642,7 +969,7 @@ def check_plex_pin(pin_id):
     if not user_info:
         return jsonify({'success': False, 'status': 'error', 'message': 'Failed to get user information'})
     
-    db_session = get_session()
+    db_session = ScopedSession()
     
     # Get configured Plex server machine identifier from settings
     settings = db_session.query(Settings).first()
@@ -711,10 +1038,15 @@ def check_plex_pin(pin_id):
     if not user:
         username = user_info.get('username') or user_info.get('email', '').split('@')[0] or f"plex_user_{user_info['plex_id']}"
         
-        # Ensure unique username
+        # Ensure unique username (one query for every taken name sharing the prefix)
         base_username = username
+        taken_usernames = {
+            name for (name,) in db_session.query(User.username).filter(
+                User.username.startswith(base_username, autoescape=True)
+            )
+        }
         counter = 1
-        while db_session.query(User).filter_by(username=username).first():
+        while username in taken_usernames:
             username = f"{base_username}_{counter}"
             counter += 1
         
@@ -773,6 +1105,9 @@ def hdhr_lineup():
     if not livetv.is_live_tv_enabled():
         return jsonify({"error": "Live TV is not enabled"}), 404
     
+    if not startup_complete.is_set():
+        return jsonify({"error": "Popcorn is still syncing"}), 503
+    
     return jsonify(livetv.get_lineup(scheduler))
 
 @app.route('/iptv/playlist.m3u')
@@ -781,6 +1116,9 @@ def iptv_playlist():
     if not livetv.is_live_tv_enabled():
         return "Live TV is not enabled", 404
     
+    if not startup_complete.is_set():
+        return "Popcorn is still syncing", 503
+    
     m3u_content = livetv.generate_m3u_playlist(scheduler)
     response = make_response(m3u_content)
     response.headers['Content-Type'] = 'audio/x-mpegurl'
@@ -793,6 +1131,9 @@ def iptv_xmltv():
     if not livetv.is_live_tv_enabled():
         return "Live TV is not enabled", 404
     
+    if not startup_complete.is_set():
+        return "Popcorn is still syncing", 503
+    
     xmltv_content = livetv.generate_xmltv_epg(scheduler)
     response = make_response(xmltv_content)
     response.headers['Content-Type'] = 'text/xml; charset=utf-8'
@@ -861,24 +1202,19 @@ def livetv_help():
 @app.route('/profile', methods=['GET', 'POST'])
 @login_required
 def profile():
-    from theme_service import ThemeService
-    from watch_history_service import WatchHistoryService
-    import json
-    
     themes = ThemeService.get_all_themes_for_user(current_user.id)
     
     if request.method == 'POST':
         theme = request.form.get('theme')
         if theme and theme in themes:
-            db_session = get_session()
-            user = db_session.query(User).get(current_user.id)
+            db_session = ScopedSession()
+            user = db_session.get(User, current_user.id)
             user.theme = theme
             db_session.commit()
             flash(f'Theme changed to {themes[theme]["name"]}!', 'success')
             return redirect(url_for('profile'))
     
-    user_theme = current_user.theme if current_user.theme else 'plex'
-    theme_colors = themes.get(user_theme, themes.get('plex', {})).get('colors', {})
+    theme_colors = ThemeService.get_theme_colors(current_user)
     
     watch_stats = WatchHistoryService.get_user_stats(current_user.id)
     
@@ -886,21 +1222,18 @@ def profile():
     # This includes genre channels from all movies (including French/non-English tags)
     # and holiday channels that are currently active
     all_channels = []
-    if scheduler:
-        all_channels = sorted(scheduler.get_all_channels())
+    # Until the startup sync finishes, the scheduler is busy regenerating every channel
+    if scheduler and startup_complete.is_set():
+        # Already sorted (and cached per day) by the scheduler
+        all_channels = scheduler.get_all_channels()
     
     # Get user's visible channels (default to all if not set)
-    visible_channels = []
-    if current_user.visible_channels:
-        try:
-            visible_channels = json.loads(current_user.visible_channels)
-        except:
-            visible_channels = all_channels
-    else:
+    visible_channels = current_user.get_visible_channels()
+    if visible_channels is None:
         visible_channels = all_channels
     
     # Get admin max brightness setting
-    db_session_local = get_session()
+    db_session_local = ScopedSession()
     settings_obj = db_session_local.query(Settings).first()
     admin_max_brightness = settings_obj.current_glow_brightness if settings_obj and settings_obj.current_glow_brightness else 100
     
@@ -915,9 +1248,8 @@ def profile():
 @app.route('/profile/preferences', methods=['POST'])
 @login_required
 def update_preferences():
-    db_session = get_session()
-    user = db_session.query(User).get(current_user.id)
-    settings_obj = db_session.query(Settings).first()
+    db_session = ScopedSession()
+    user = db_session.get(User, current_user.id)
     
     user.enable_crt_mode = 'enable_crt_mode' in request.form
     user.enable_film_grain = 'enable_film_grain' in request.form
@@ -926,19 +1258,13 @@ def update_preferences():
     user.plex_client = request.form.get('plex_client', '').strip() or None
     
     # Handle user brightness with validation against admin max
-    brightness = request.form.get('current_glow_brightness')
-    if brightness is not None:
-        try:
-            brightness_val = int(brightness)
-            # Get admin max brightness
-            admin_max = settings_obj.current_glow_brightness if settings_obj and settings_obj.current_glow_brightness else 100
-            # Constrain user brightness to admin max
-            if 0 <= brightness_val <= admin_max:
-                user.current_glow_brightness = brightness_val
-            else:
-                user.current_glow_brightness = min(brightness_val, admin_max)
-        except ValueError:
-            pass
+    brightness = request.form.get('current_glow_brightness', '').strip()
+    if brightness.isdecimal():
+        # Get admin max brightness
+        settings_obj = db_session.query(Settings).first()
+        admin_max = settings_obj.current_glow_brightness if settings_obj and settings_obj.current_glow_brightness else 100
+        # Constrain user brightness to admin max
+        user.current_glow_brightness = min(int(brightness), admin_max)
     
     db_session.commit()
     flash('Viewing preferences saved successfully!', 'success')
@@ -947,21 +1273,18 @@ def update_preferences():
 @app.route('/profile/channels', methods=['POST'])
 @login_required
 def update_channel_visibility():
-    import json
-    from channel_numbers import CHANNEL_NUMBERS
+    db_session = ScopedSession()
+    user = db_session.get(User, current_user.id)
     
-    db_session = get_session()
-    user = db_session.query(User).get(current_user.id)
-    
-    # Get all channels that were checked
-    visible_channels = request.form.getlist('visible_channels')
+    # Get all channels that were checked (a repeated field only counts once)
+    visible_channels = list(dict.fromkeys(request.form.getlist('visible_channels')))
     
     # If no channels selected, show all channels (default)
     if not visible_channels:
-        visible_channels = list(CHANNEL_NUMBERS.keys())
+        visible_channels = DEFAULT_VISIBLE_CHANNELS
     
-    # Save as JSON
-    user.visible_channels = json.dumps(visible_channels)
+    # Save as compact JSON; readers decode it once per distinct value (models.decode_visible_channels)
+    user.visible_channels = json.dumps(visible_channels, separators=(',', ':'))
     db_session.commit()
     
     flash(f'Channel preferences saved! {len(visible_channels)} channels visible.', 'success')
@@ -978,8 +1301,8 @@ def change_password():
         flash('All password fields are required.', 'error')
         return redirect(url_for('profile'))
     
-    db_session = get_session()
-    user = db_session.query(User).get(current_user.id)
+    db_session = ScopedSession()
+    user = db_session.get(User, current_user.id)
     
     if not user.check_password(current_password):
         flash('Current password is incorrect.', 'error')
@@ -1008,77 +1331,74 @@ def index():
 @app.route('/guide')
 @login_required
 def guide():
-    from theme_service import ThemeService
-    from channel_numbers import get_channel_number, get_channel_icon
-    from watch_history_service import WatchHistoryService
-    from models import MovieFavorite
-    import json
-    
-    themes = ThemeService.get_all_themes_for_user(current_user.id)
-    
-    user_theme = current_user.theme if current_user.theme else 'plex'
-    theme_colors = themes.get(user_theme, themes.get('plex', {})).get('colors', {})
-    
-    # Get user's favorited movie IDs
-    session = get_session()
-    user_favorites = session.query(MovieFavorite.movie_id).filter_by(user_id=current_user.id).all()
-    favorited_ids = {fav[0] for fav in user_favorites}
+    theme_colors = ThemeService.get_theme_colors(current_user)
     
     if not scheduler:
         return render_template('error.html', message="Application not initialized", theme_colors=theme_colors)
     
-    channels = scheduler.get_all_channels()
+    if not startup_complete.is_set():
+        return render_template('error.html', message="Popcorn is still syncing your library. Refresh in a moment.", theme_colors=theme_colors)
     
-    # Filter channels based on user preferences
-    visible_channels = None
-    if current_user.visible_channels:
-        try:
-            visible_channels = json.loads(current_user.visible_channels)
-        except:
-            visible_channels = None
+    # If user has channel preferences, only those channels are scheduled and rendered
+    channels = scheduler.get_all_channels(visible=current_user.visible_channels_set)
     
-    # If user has channel preferences, filter the channels
-    if visible_channels:
-        channels = [ch for ch in channels if ch in visible_channels]
+    day = datetime.now().weekday()
+    cache_version, schedules = scheduler.get_day_schedules(channels, day)
+    
+    # Get user's favorited movie IDs. Kept as a separate per-user query: the schedule lists
+    # are cached across users, so a per-user EXISTS column can't live in that query
+    session = ScopedSession()
+    # The guide only reads, so there is never anything to flush before these queries
+    with session.no_autoflush:
+        favorited_ids = {
+            movie_id for (movie_id,) in session.query(MovieFavorite.movie_id).filter_by(user_id=current_user.id)
+        }
+        
+        # Load watch state for every movie in the guide up front instead of two queries per program
+        plex_ids = {item.movie.plex_id for _, schedule in schedules for item in schedule}
+        watched_ids, progress_by_id = WatchHistoryService.bulk_watch_state(current_user.id, plex_ids)
     
     guide_data = []
-    for channel in channels:
-        schedule = scheduler.get_channel_schedule(channel)
-        programs = []
+    # Watch progress by movie id; guide.html applies it to the progress bars client-side
+    user_progress = {}
+    for channel, schedule in schedules:
+        number, icon = get_channel_meta(channel)
+        
+        state = tuple(
+            (item.movie.plex_id in watched_ids, item.movie.id in favorited_ids)
+            for item in schedule
+        )
+        row_key = (cache_version, day, channel, state)
+        row_html = guide_row_cache.get(row_key)
+        
+        if row_html is None:
+            programs = [
+                Program(
+                    item.movie, item.start_time, item.end_time, item.start_minute, item.duration_minutes,
+                    has_watched, is_favorited
+                )
+                for item, (has_watched, is_favorited) in zip(schedule, state)
+            ]
+            
+            row_html = Markup(render_template('guide_channel_row.html', channel={
+                'name': channel,
+                'number': number,
+                'programs': programs
+            }))
+            guide_row_cache.set(row_key, row_html)
         
         for item in schedule:
-            start_min = time_to_minutes(item.start_time)
-            end_min = time_to_minutes(item.end_time)
-            duration_min = end_min - start_min if end_min > start_min else (1440 - start_min + end_min)
-            
-            has_watched = WatchHistoryService.has_watched(current_user.id, item.movie.plex_id)
-            progress_ms = WatchHistoryService.get_progress(current_user.id, item.movie.plex_id)
-            
             # Calculate progress percentage
-            progress_percent = 0
+            progress_ms = progress_by_id.get(item.movie.plex_id, 0)
             if progress_ms > 0 and item.movie.duration > 0:
                 movie_duration_ms = item.movie.duration * 60 * 1000
-                progress_percent = min((progress_ms / movie_duration_ms) * 100, 100)
-            
-            is_favorited = item.movie.id in favorited_ids
-            
-            programs.append({
-                'movie': item.movie,
-                'start_time': item.start_time,
-                'end_time': item.end_time,
-                'start_minute': start_min,
-                'duration_minutes': duration_min,
-                'watched': has_watched,
-                'progress_percent': progress_percent,
-                'progress_ms': progress_ms,
-                'is_favorited': is_favorited
-            })
+                user_progress[item.movie.id] = min((progress_ms / movie_duration_ms) * 100, 100)
         
         guide_data.append({
             'name': channel,
-            'number': get_channel_number(channel),
-            'icon': get_channel_icon(channel),
-            'programs': programs
+            'number': number,
+            'icon': icon,
+            'row_html': row_html
         })
     
     current_minutes = get_current_minutes()
@@ -1090,22 +1410,21 @@ def guide():
     return render_template('guide.html', 
                          channels=guide_data, 
                          current_minutes=current_minutes,
+                         user_progress=user_progress,
                          theme_colors=theme_colors,
                          glow_opacity=glow_opacity)
 
 @app.route('/channels')
 @login_required
 def channels_list():
-    from theme_service import ThemeService
-    
-    themes = ThemeService.get_all_themes_for_user(current_user.id)
-    
-    user_theme = current_user.theme if current_user.theme else 'plex'
-    theme_colors = themes.get(user_theme, themes.get('plex', {})).get('colors', {})
+    theme_colors = ThemeService.get_theme_colors(current_user)
     
     if not scheduler:
         return render_template('error.html', message="Application not initialized", theme_colors=theme_colors)
     
+    if not startup_complete.is_set():
+        return render_template('error.html', message="Popcorn is still syncing your library. Refresh in a moment.", theme_colors=theme_colors)
+    
     channels = scheduler.get_all_channels()
     
     channel_info = []
@@ -1121,16 +1440,14 @@ def channels_list():
 @app.route('/channel/<channel_name>')
 @login_required
 def channel(channel_name):
-    from theme_service import ThemeService
-    
-    themes = ThemeService.get_all_themes_for_user(current_user.id)
-    
-    user_theme = current_user.theme if current_user.theme else 'plex'
-    theme_colors = themes.get(user_theme, themes.get('plex', {})).get('colors', {})
+    theme_colors = ThemeService.get_theme_colors(current_user)
     
     if not scheduler:
         return render_template('error.html', message="Application not initialized", theme_colors=theme_colors)
     
+    if not startup_complete.is_set():
+        return render_template('error.html', message="Popcorn is still syncing your library. Refresh in a moment.", theme_colors=theme_colors)
+    
     current = scheduler.get_current_playing(channel_name)
     schedule = scheduler.get_channel_schedule(channel_name)
     
@@ -1146,9 +1463,11 @@ def play(movie_id):
     if not plex_api:
         return jsonify({'success': False, 'message': 'Plex API not available'})
     
-    from models import Movie, WatchHistory
-    session = get_session()
-    movie = session.query(Movie).filter_by(id=movie_id).first()
+    session = ScopedSession()
+    # Playback only needs these; skip summary/cast and the other wide text columns
+    movie = session.get(Movie, movie_id, options=[
+        load_only(Movie.id, Movie.plex_id, Movie.title, Movie.genre, Movie.duration)
+    ])
     
     if not movie:
         return jsonify({'success': False, 'message': 'Movie not found'})
@@ -1196,29 +1515,29 @@ def play(movie_id):
 @app.route('/api/favorite/<int:movie_id>', methods=['POST'])
 @login_required
 def toggle_favorite(movie_id):
-    from models import Movie, MovieFavorite
-    session = get_session()
+    session = ScopedSession()
     
-    movie = session.query(Movie).filter_by(id=movie_id).first()
+    movie = session.get(Movie, movie_id, options=[load_only(Movie.id, Movie.plex_id)])
     if not movie:
         return jsonify({'success': False, 'message': 'Movie not found'}), 404
     
-    existing_favorite = session.query(MovieFavorite).filter_by(
+    # Try removing first; the DELETE's row count says whether it was a favorite,
+    # so no separate lookup is needed
+    removed = session.query(MovieFavorite).filter_by(
         user_id=current_user.id,
         movie_id=movie_id
-    ).first()
+    ).delete(synchronize_session=False)
     
-    if existing_favorite:
-        session.delete(existing_favorite)
+    if removed:
         session.commit()
         return jsonify({'success': True, 'favorited': False, 'message': 'Removed from favorites'})
     else:
-        favorite = MovieFavorite(
+        # A double click can race us here; the unique constraint makes the second insert a no-op
+        session.execute(sqlite_insert(MovieFavorite).values(
             user_id=current_user.id,
             movie_id=movie_id,
             plex_id=movie.plex_id
-        )
-        session.add(favorite)
+        ).on_conflict_do_nothing(index_elements=['user_id', 'movie_id']))
         session.commit()
         return jsonify({'success': True, 'favorited': True, 'message': 'Added to favorites'})
 
@@ -1229,7 +1548,7 @@ def settings():
         flash('Only administrators can access settings', 'error')
         return redirect(url_for('guide'))
     
-    db_session = get_session()
+    db_session = ScopedSession()
     settings_obj = db_session.query(Settings).first()
     
     if not settings_obj:
@@ -1244,7 +1563,6 @@ def settings():
             settings_obj.plex_url = request.form.get('plex_url', '').strip() or None
             settings_obj.plex_token = request.form.get('plex_token', '').strip() or None
             # plex_client is now per-user setting, not admin setting
-            db_session.commit()
             
             try:
                 plex_api = PlexAPI(db_settings=settings_obj)
@@ -1254,7 +1572,6 @@ def settings():
                 if plex_api.plex:
                     machine_id = plex_api.plex.machineIdentifier
                     settings_obj.plex_machine_identifier = machine_id
-                    db_session.commit()
                     logger.info(f"Stored Plex machine identifier: {machine_id}")
                 
                 # Get available libraries
@@ -1263,13 +1580,16 @@ def settings():
                     # Only auto-select all libraries on first connect
                     if not settings_obj.selected_movie_libraries:
                         settings_obj.selected_movie_libraries = ','.join(available_libraries)
-                        db_session.commit()
                         logger.info(f"Auto-selected all {len(available_libraries)} movie libraries on first connection: {available_libraries}")
                     else:
                         logger.info(f"Preserving existing library selection. Use library settings to modify selection.")
                 else:
                     logger.warning("No movie libraries found on Plex server")
                 
+                # Save the connection, machine identifier and library selection in one commit;
+                # sync_movies reads them back through its own session
+                db_session.commit()
+                
                 sync_movies()
                 scheduler.generate_all_schedules(force=True)
                 
@@ -1279,6 +1599,8 @@ def settings():
             except Exception as e:
                 logger.error(f"Failed to connect to Plex with new settings: {e}", exc_info=True)
                 plex_api = None
+                # Keep the new URL and token even though connecting with them failed
+                db_session.commit()
                 flash('Settings saved, but connection failed. Please check your Plex URL and token.', 'error')
                 return redirect(url_for('settings', plex_error=1))
         elif 'tmdb_api_key' in request.form:
@@ -1332,7 +1654,8 @@ def settings():
                 return redirect(url_for('settings'))
             
             # Validate all selected libraries exist
-            invalid_libraries = [lib for lib in selected_libraries if lib not in available_libraries]
+            selected_set = set(selected_libraries)
+            invalid_libraries = sorted(selected_set.difference(available_libraries))
             if invalid_libraries:
                 flash(f'Invalid libraries selected: {", ".join(invalid_libraries)}', 'error')
                 return redirect(url_for('settings'))
@@ -1348,16 +1671,21 @@ def settings():
             logger.info(f"Library selection updated: {selected_libraries}")
             
             # Find deselected libraries
-            deselected_libraries = [lib for lib in old_selected if lib not in selected_libraries]
+            deselected_libraries = sorted(set(old_selected) - selected_set)
             
             # Delete movies from deselected libraries
             if deselected_libraries:
-                deleted_count = 0
-                for library_name in deselected_libraries:
-                    movies_to_delete = db_session.query(Movie).filter_by(library_name=library_name).all()
-                    deleted_count += len(movies_to_delete)
-                    for movie in movies_to_delete:
-                        db_session.delete(movie)
+                # Bulk deletes bypass the ORM cascades on Movie, so clear dependent rows the same way:
+                # schedules, overrides and favorites go, watch history keeps its entry without the link
+                doomed_ids = select(Movie.id).where(Movie.library_name.in_(deselected_libraries))
+                for model in (Schedule, MovieOverride, MovieFavorite):
+                    db_session.query(model).filter(model.movie_id.in_(doomed_ids)).delete(synchronize_session=False)
+                db_session.query(WatchHistory).filter(WatchHistory.movie_id.in_(doomed_ids)).update(
+                    {'movie_id': None}, synchronize_session=False
+                )
+                deleted_count = db_session.query(Movie).filter(
+                    Movie.library_name.in_(deselected_libraries)
+                ).delete(synchronize_session=False)
                 db_session.commit()
                 logger.info(f"Deleted {deleted_count} movies from deselected libraries: {deselected_libraries}")
             
@@ -1371,18 +1699,14 @@ def settings():
             return redirect(url_for('settings'))
         else:
             frequency = request.form.get('shuffle_frequency')
-            brightness = request.form.get('current_glow_brightness')
+            brightness = request.form.get('current_glow_brightness', '').strip()
             
             if frequency in ['daily', 'weekly', 'monthly']:
                 settings_obj.shuffle_frequency = frequency
             
-            if brightness is not None:
-                try:
-                    brightness_val = int(brightness)
-                    if 0 <= brightness_val <= 100:
-                        settings_obj.current_glow_brightness = brightness_val
-                except ValueError:
-                    pass
+            # isdecimal() rules out empty, signed and non-numeric input without raising
+            if brightness.isdecimal() and int(brightness) <= 100:
+                settings_obj.current_glow_brightness = int(brightness)
             
             db_session.commit()
             
@@ -1396,11 +1720,7 @@ def settings():
     reshuffled = request.args.get('reshuffled')
     plex_saved = request.args.get('plex_saved')
     
-    from theme_service import ThemeService
-    themes = ThemeService.get_all_themes_for_user(current_user.id)
-    
-    user_theme = current_user.theme if current_user.theme else 'plex'
-    theme_colors = themes.get(user_theme, themes.get('plex', {})).get('colors', {})
+    theme_colors = ThemeService.get_theme_colors(current_user)
     
     channels = db_session.query(HolidayChannel).order_by(HolidayChannel.name).all()
     
@@ -1434,8 +1754,7 @@ def test_plex_connection():
         return jsonify({'success': False, 'message': 'Plex URL and Token are required'})
     
     try:
-        from plex_api import PlexServer
-        test_plex = PlexServer(plex_url, plex_token)
+        test_plex = PlexServer(plex_url, plex_token, session=utils.http_session)
         server_name = test_plex.friendlyName
         return jsonify({
             'success': True,
@@ -1460,7 +1779,6 @@ def test_tmdb_connection():
         return jsonify({'success': False, 'message': 'TMDB API key is required'})
     
     try:
-        from tmdb_api import TMDBAPI
         test_tmdb = TMDBAPI(api_key=tmdb_api_key)
         
         # Make a simple test request to validate the API key
@@ -1504,8 +1822,7 @@ def get_clients():
 @login_required
 def get_user_devices():
     """Get all saved devices for current user"""
-    from models import UserDevice
-    session = get_session()
+    session = ScopedSession()
     
     devices = session.query(UserDevice).filter_by(user_id=current_user.id).order_by(UserDevice.is_default.desc(), UserDevice.device_name).all()
     
@@ -1524,8 +1841,7 @@ def get_user_devices():
 @login_required
 def save_device():
     """Save a new device for current user"""
-    from models import UserDevice
-    session = get_session()
+    session = ScopedSession()
     
     data = request.get_json()
     device_name = data.get('device_name')
@@ -1580,20 +1896,18 @@ def save_device():
 @login_required
 def set_default_device(device_id):
     """Set a device as default for current user"""
-    from models import UserDevice
-    session = get_session()
+    session = ScopedSession()
     
-    # Get the device
-    device = session.query(UserDevice).filter_by(id=device_id, user_id=current_user.id).first()
+    # Make sure the device belongs to this user
+    device = session.query(UserDevice.id).filter_by(id=device_id, user_id=current_user.id).first()
     
     if not device:
         return jsonify({'success': False, 'message': 'Device not found'}), 404
     
-    # Unset all defaults
-    session.query(UserDevice).filter_by(user_id=current_user.id).update({'is_default': False})
-    
-    # Set this device as default
-    device.is_default = True
+    # Flip every default in one UPDATE: true for this device, false for the rest
+    session.query(UserDevice).filter_by(user_id=current_user.id).update(
+        {'is_default': UserDevice.id == device_id}, synchronize_session=False
+    )
     session.commit()
     
     return jsonify({'success': True, 'message': 'Default device updated'})
@@ -1602,8 +1916,7 @@ def set_default_device(device_id):
 @login_required
 def delete_device(device_id):
     """Delete a saved device"""
-    from models import UserDevice
-    session = get_session()
+    session = ScopedSession()
     
     device = session.query(UserDevice).filter_by(id=device_id, user_id=current_user.id).first()
     
@@ -1621,9 +1934,8 @@ def api_deeplink(movie_id):
     if not plex_api:
         return jsonify({'success': False, 'message': 'Plex API not available'})
     
-    from models import Movie
-    session = get_session()
-    movie = session.query(Movie).filter_by(id=movie_id).first()
+    session = ScopedSession()
+    movie = session.get(Movie, movie_id)
     
     if not movie:
         return jsonify({'success': False, 'message': 'Movie not found'})
@@ -1648,13 +1960,79 @@ def get_poster(plex_id):
     cached_image = image_cache.get(plex_id)
     if cached_image:
         logger.debug(f"Serving cached poster for plex_id: {plex_id}")
-        response = make_response(cached_image['data'])
-        response.headers['Content-Type'] = cached_image['content_type']
-        response.headers['Cache-Control'] = 'public, max-age=2592000'  # 30 days
-        return response
+        return poster_response(cached_image)
     
-    # Fetch from Plex
-    db_session = get_session()
+    image_url = get_poster_url(plex_id)
+    
+    # The ETag comes from the Plex image URL, so a browser revalidating a poster it already
+    # has gets a 304 even when our cache is cold, without touching Plex or the disk tier
+    etag = poster_etag(image_url)
+    if request.if_none_match.contains(etag):
+        return poster_response(CachedPoster(b'', 'image/jpeg', etag))
+    
+    disk_poster = find_disk_poster(plex_id)
+    if disk_poster:
+        return disk_poster_response(disk_poster, etag)
+    
+    if poster_recently_failed(plex_id):
+        abort(404)
+    
+    # Another request is already fetching this poster - wait for it rather than hitting Plex twice
+    is_owner, fetch_done = image_cache.begin_fetch(plex_id)
+    if not is_owner:
+        fetch_done.wait(timeout=15)
+        cached_image = image_cache.get(plex_id)
+        if cached_image:
+            return poster_response(cached_image)
+        disk_poster = find_disk_poster(plex_id)
+        if disk_poster:
+            return disk_poster_response(disk_poster, etag)
+        # The other fetch failed or timed out; try once ourselves
+        return stream_poster(plex_id, image_url)
+    
+    try:
+        response = stream_poster(plex_id, image_url)
+    except BaseException:
+        image_cache.end_fetch(plex_id)
+        raise
+    # Waiting requests are released once the body has been streamed and cached
+    response.call_on_close(lambda: image_cache.end_fetch(plex_id))
+    return response
+
+def disk_poster_response(filename, etag):
+    """Serve a poster from the disk tier, via nginx when X-Accel-Redirect is configured"""
+    ext = os.path.splitext(filename)[1]
+    content_type = next((ct for ct, e in POSTER_EXTENSIONS.items() if e == ext), 'image/jpeg')
+    if POSTER_ACCEL_REDIRECT:
+        response = make_response('')
+        response.headers['X-Accel-Redirect'] = f"{POSTER_ACCEL_REDIRECT.rstrip('/')}/{filename}"
+        response.headers['Content-Type'] = content_type
+        # Same URL-derived ETag as the memory tier, so revalidation doesn't depend on which tier answered
+        response.set_etag(etag)
+    else:
+        response = send_file(os.path.join(POSTER_CACHE_DIR, filename), mimetype=content_type,
+                             conditional=True, etag=etag)
+    response.headers['Cache-Control'] = 'public, max-age=2592000'  # 30 days
+    return response
+
+def poster_etag(image_url):
+    """Stable ETag for a poster; Plex image URLs change whenever the artwork does"""
+    return hashlib.blake2b(image_url.encode(), digest_size=16).hexdigest()
+
+def poster_response(image_data):
+    """Build a long-lived cacheable response for a poster, answering conditional requests with 304"""
+    if request.if_none_match.contains(image_data.etag):
+        response = make_response('', 304)
+    else:
+        # send_file hands the body to the server's file_wrapper instead of buffering a copy
+        response = send_file(BytesIO(image_data.data), mimetype=image_data.content_type)
+    response.set_etag(image_data.etag)
+    response.headers['Cache-Control'] = 'public, max-age=2592000'  # 30 days
+    return response
+
+def get_poster_url(plex_id):
+    """Look up the Plex image URL for a movie, aborting with 404 if there isn't one"""
+    db_session = ScopedSession()
     settings = db_session.query(Settings).first()
     
     if not settings or not settings.plex_url or not settings.plex_token:
@@ -1673,29 +2051,103 @@ def get_poster(plex_id):
         logger.error(f"No art/poster URL found for plex_id: {plex_id}")
         abort(404)
     
+    return image_url
+
+def stream_poster(plex_id, image_url):
+    """Stream a poster from Plex to the client as it downloads, caching it once complete"""
     try:
-        # Fetch image from Plex
-        plex_response = requests.get(image_url, timeout=10)
+        plex_response = utils.http_session.get(image_url, timeout=10, stream=True)
         plex_response.raise_for_status()
-        
-        # Cache the image (with LRU eviction if needed)
-        image_data = {
-            'data': plex_response.content,
-            'content_type': plex_response.headers.get('Content-Type', 'image/jpeg')
-        }
-        image_cache.set(plex_id, image_data)
-        
-        logger.info(f"Cached poster for plex_id: {plex_id} ({len(plex_response.content)} bytes, cache size: {len(image_cache.cache)})")
-        
-        # Return image with cache headers
-        flask_response = make_response(plex_response.content)
-        flask_response.headers['Content-Type'] = image_data['content_type']
-        flask_response.headers['Cache-Control'] = 'public, max-age=2592000'  # 30 days
-        return flask_response
-        
     except requests.RequestException as e:
         logger.error(f"Failed to fetch poster for plex_id {plex_id}: {e}")
+        _failed_posters[plex_id] = time.monotonic() + POSTER_FAILURE_TTL
         abort(404)
+    
+    content_type = plex_response.headers.get('Content-Type', 'image/jpeg')
+    etag = poster_etag(image_url)
+    
+    def generate():
+        download = PosterDownload(plex_id, content_type, etag)
+        try:
+            for chunk in plex_response.iter_content(chunk_size=POSTER_CHUNK_SIZE):
+                download.write(chunk)
+                yield chunk
+            # Only a fully downloaded image makes it into the cache
+            download.finish()
+        finally:
+            download.discard()
+        logger.debug("Cached poster for plex_id: %s (%d bytes, cache size: %d posters, %d bytes)",
+                     plex_id, download.size, len(image_cache.cache), image_cache.current_bytes)
+    
+    response = app.response_class(generate(), content_type=content_type)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'public, max-age=2592000'  # 30 days
+    response.call_on_close(plex_response.close)
+    return response
+
+def download_poster(plex_id, image_url):
+    """Download an image from Plex into the poster cache; raises requests.RequestException on failure"""
+    with utils.http_session.get(image_url, timeout=10, stream=True) as plex_response:
+        plex_response.raise_for_status()
+        
+        download = PosterDownload(
+            plex_id,
+            plex_response.headers.get('Content-Type', 'image/jpeg'),
+            poster_etag(image_url)
+        )
+        try:
+            for chunk in plex_response.iter_content(chunk_size=POSTER_CHUNK_SIZE):
+                download.write(chunk)
+            download.finish()
+        finally:
+            download.discard()
+    
+    logger.debug("Cached poster for plex_id: %s (%d bytes, cache size: %d posters, %d bytes)",
+                 plex_id, download.size, len(image_cache.cache), image_cache.current_bytes)
+
+def prefetch_todays_posters():
+    """Warm the image cache with art for today's schedule using a small pool of download threads"""
+    session = get_session()
+    try:
+        rows = session.query(Movie.plex_id, Movie.art_url, Movie.poster_url).join(
+            Schedule, Schedule.movie_id == Movie.id
+        ).filter(Schedule.day == datetime.now().weekday()).order_by(Schedule.start_time).all()
+    finally:
+        session.close()
+    
+    # One download per movie, in airing order, up to the prefetch limit
+    image_urls = {}
+    for plex_id, art_url, poster_url in rows:
+        image_url = art_url or poster_url
+        if image_url and plex_id not in image_urls and plex_id not in image_cache and not find_disk_poster(plex_id):
+            image_urls[plex_id] = image_url
+            if len(image_urls) >= POSTER_PREFETCH_LIMIT:
+                break
+    
+    def prefetch(plex_id, image_url):
+        # Skip posters a request is already fetching
+        is_owner, _ = image_cache.begin_fetch(plex_id)
+        if not is_owner:
+            return
+        try:
+            download_poster(plex_id, image_url)
+        except requests.RequestException as e:
+            logger.warning(f"Could not prefetch poster for plex_id {plex_id}: {e}")
+            _failed_posters[plex_id] = time.monotonic() + POSTER_FAILURE_TTL
+        finally:
+            image_cache.end_fetch(plex_id)
+    
+    logger.info(f"Prefetching {len(image_urls)} posters for today's schedule")
+    with ThreadPoolExecutor(max_workers=max(POSTER_PREFETCH_WORKERS, 1)) as executor:
+        futures = {
+            executor.submit(prefetch, plex_id, image_url): plex_id
+            for plex_id, image_url in image_urls.items()
+        }
+        # Surface anything prefetch() didn't handle instead of losing it with the future
+        for future in as_completed(futures):
+            error = future.exception()
+            if error:
+                logger.warning(f"Unexpected error prefetching poster for plex_id {futures[future]}: {error}")
 
 @app.route('/api/update/check')
 @login_required
@@ -1703,21 +2155,20 @@ def check_for_updates():
     if not current_user.is_admin:
         return jsonify({'success': False, 'message': 'Admin access required'}), 403
     
-    from updater import UpdateManager
-    from models import AppVersion
     
-    session = get_session()
+    session = ScopedSession()
     version_record = session.query(AppVersion).first()
     
     if not version_record:
+        current_version = UpdateManager().get_current_version()
         version_record = AppVersion(
-            current_version=UpdateManager().get_current_version(),
-            current_commit=UpdateManager().get_current_version()
+            current_version=current_version,
+            current_commit=current_version
         )
         session.add(version_record)
-        session.commit()
     
-    updater = UpdateManager(github_repo=version_record.github_repo)
+    # The new row (if any) is saved by the commit below along with the check result
+    updater = UpdateManager(github_repo=version_record.github_repo or 'netpersona/Popcorn')
     update_info = updater.check_for_updates()
     
     if update_info.get('available'):
@@ -1741,20 +2192,23 @@ def check_for_updates():
         'is_docker': update_info.get('is_docker', False)
     })
 
+def get_update_repo():
+    """GitHub repo updates are pulled from: the stored AppVersion.github_repo, or upstream"""
+    return ScopedSession().query(AppVersion.github_repo).limit(1).scalar() or 'netpersona/Popcorn'
+
 @app.route('/api/update/stream')
 @login_required
 def update_stream():
     if not current_user.is_admin:
         return jsonify({'success': False, 'message': 'Admin access required'}), 403
     
-    from updater import UpdateManager
-    from models import AppVersion
-    import queue
-    import threading
     
-    session = get_session()
-    version_record = session.query(AppVersion).first()
-    github_repo = version_record.github_repo if version_record else 'netpersona/Popcorn'
+    github_repo = get_update_repo()
+    
+    # Only one update may run at a time; a second request would pin another worker thread
+    # and race the first one's git pull/migrations
+    if not update_lock.acquire(blocking=False):
+        return jsonify({'success': False, 'message': 'An update is already in progress'}), 409
     
     message_queue = queue.Queue()
     updater = UpdateManager(github_repo=github_repo)
@@ -1773,29 +2227,15 @@ def update_stream():
         except Exception as e:
             logger.error(f"Update failed: {e}", exc_info=True)
             message_queue.put({'error': 'Update failed. Please check the logs for details.'})
+        finally:
+            update_lock.release()
     
     update_thread = threading.Thread(target=perform_update_async)
     update_thread.daemon = True
     update_thread.start()
     
-    def generate():
-        while True:
-            try:
-                msg = message_queue.get(timeout=30)
-                
-                if 'done' in msg:
-                    yield f"data: {json.dumps(msg)}\n\n"
-                    break
-                elif 'error' in msg:
-                    yield f"data: {json.dumps(msg)}\n\n"
-                    break
-                else:
-                    yield f"data: {json.dumps(msg)}\n\n"
-            except queue.Empty:
-                yield f"data: {json.dumps({'heartbeat': True})}\n\n"
-    
     return app.response_class(
-        generate(),
+        sse_progress_events(message_queue),
         mimetype='text/event-stream',
         headers={
             'Cache-Control': 'no-cache',
@@ -1803,18 +2243,35 @@ def update_stream():
         }
     )
 
+# Heartbeats are identical every time, so encode the event once. Send one after this many
+# idle seconds; git pulls and migrations can go quiet long enough for a proxy to drop the stream
+SSE_HEARTBEAT = f"data: {json.dumps({'heartbeat': True})}\n\n"
+SSE_HEARTBEAT_INTERVAL = 15
+
+def sse_progress_events(message_queue):
+    """Yield progress messages from a worker thread as server-sent events until done/error"""
+    while True:
+        try:
+            msg = message_queue.get(timeout=SSE_HEARTBEAT_INTERVAL)
+        except queue.Empty:
+            yield SSE_HEARTBEAT
+            continue
+        
+        yield f"data: {json.dumps(msg, separators=(',', ':'))}\n\n"
+        if 'done' in msg or 'error' in msg:
+            break
+
 @app.route('/api/update/apply', methods=['POST'])
 @login_required
 def apply_update():
     if not current_user.is_admin:
         return jsonify({'success': False, 'message': 'Admin access required'}), 403
     
-    from updater import UpdateManager
-    from models import AppVersion
     
-    session = get_session()
-    version_record = session.query(AppVersion).first()
-    github_repo = version_record.github_repo if version_record else 'netpersona/Popcorn'
+    github_repo = get_update_repo()
+    
+    if not update_lock.acquire(blocking=False):
+        return jsonify({'success': False, 'message': 'An update is already in progress'}), 409
     
     try:
         updater = UpdateManager(github_repo=github_repo)
@@ -1823,6 +2280,8 @@ def apply_update():
     except Exception as e:
         logger.error(f"Error applying update: {e}", exc_info=True)
         return jsonify({'success': False, 'message': 'Update failed. Please try again or check the logs.'})
+    finally:
+        update_lock.release()
 
 @app.route('/api/ffmpeg/install/stream', methods=['POST'])
 @login_required
@@ -1831,13 +2290,6 @@ def install_ffmpeg_stream():
     if not current_user.is_admin:
         return jsonify({'success': False, 'error': 'Admin access required'}), 403
     
-    import platform
-    import subprocess
-    import requests
-    from pathlib import Path
-    import os
-    import queue
-    import threading
     
     message_queue = queue.Queue()
     
@@ -2017,24 +2469,8 @@ def install_ffmpeg_stream():
     install_thread.daemon = True
     install_thread.start()
     
-    def generate():
-        while True:
-            try:
-                msg = message_queue.get(timeout=30)
-                
-                if 'done' in msg:
-                    yield f"data: {json.dumps(msg)}\n\n"
-                    break
-                elif 'error' in msg:
-                    yield f"data: {json.dumps(msg)}\n\n"
-                    break
-                else:
-                    yield f"data: {json.dumps(msg)}\n\n"
-            except queue.Empty:
-                yield f"data: {json.dumps({'heartbeat': True})}\n\n"
-    
     return app.response_class(
-        generate(),
+        sse_progress_events(message_queue),
         mimetype='text/event-stream',
         headers={
             'Cache-Control': 'no-cache',
@@ -2049,11 +2485,6 @@ def install_ffmpeg():
     if not current_user.is_admin:
         return jsonify({'success': False, 'error': 'Admin access required'}), 403
     
-    import platform
-    import subprocess
-    import requests
-    from pathlib import Path
-    import os
     
     temp_archive = None
     extracted_dir = None
@@ -2204,9 +2635,6 @@ def remove_ffmpeg():
     if not current_user.is_admin:
         return jsonify({'success': False, 'error': 'Admin access required'}), 403
     
-    import shutil
-    from pathlib import Path
-    import os
     
     try:
         ffmpeg_dir = Path('/data/ffmpeg')
@@ -2262,7 +2690,6 @@ def upload_theme():
         logging.exception("Failed to read uploaded theme file")
         return jsonify({'success': False, 'message': 'Failed to read file.'}), 400
     
-    from theme_service import ThemeService
     is_public = request.form.get('is_public') == 'true' if current_user.is_admin else False
     
     success, error, theme = ThemeService.save_custom_theme(
@@ -2289,14 +2716,12 @@ def upload_theme():
 @app.route('/api/themes/custom')
 @login_required
 def get_custom_themes():
-    from theme_service import ThemeService
     themes = ThemeService.get_user_custom_themes(current_user.id)
     return jsonify({'success': True, 'themes': themes})
 
 @app.route('/api/themes/<int:theme_id>', methods=['DELETE'])
 @login_required
 def delete_theme(theme_id):
-    from theme_service import ThemeService
     success, error = ThemeService.delete_custom_theme(current_user.id, theme_id)
     
     if success:
@@ -2309,19 +2734,13 @@ def delete_theme(theme_id):
 @app.route('/deeplink/<int:movie_id>')
 @login_required
 def deeplink(movie_id):
-    from theme_service import ThemeService
-    
-    themes = ThemeService.get_all_themes_for_user(current_user.id)
-    
-    user_theme = current_user.theme if current_user.theme else 'plex'
-    theme_colors = themes.get(user_theme, themes.get('plex', {})).get('colors', {})
+    theme_colors = ThemeService.get_theme_colors(current_user)
     
     if not plex_api:
         return render_template('error.html', message="Plex API not available", theme_colors=theme_colors)
     
-    from models import Movie
-    session = get_session()
-    movie = session.query(Movie).filter_by(id=movie_id).first()
+    session = ScopedSession()
+    movie = session.get(Movie, movie_id)
     
     if not movie:
         return render_template('error.html', message="Movie not found", theme_colors=theme_colors)
@@ -2355,13 +2774,10 @@ def create_holiday_channel():
         flash('Only administrators can access this page', 'error')
         return redirect(url_for('guide'))
     
-    from theme_service import ThemeService
-    themes = ThemeService.get_all_themes_for_user(current_user.id)
-    user_theme = current_user.theme if current_user.theme else 'plex'
-    theme_colors = themes.get(user_theme, themes.get('plex', {})).get('colors', {})
+    theme_colors = ThemeService.get_theme_colors(current_user)
     
     if request.method == 'POST':
-        db = get_session()
+        db = ScopedSession()
         try:
             name = request.form.get('name', '').strip()
             start_month = int(request.form.get('start_month', 1))
@@ -2419,7 +2835,7 @@ def create_holiday_channel():
             flash('Error creating channel. Please check your inputs and try again.', 'error')
             return redirect(url_for('create_holiday_channel'))
     
-    db = get_session()
+    db = ScopedSession()
     settings_obj = db.query(Settings).first()
     has_tmdb = settings_obj and settings_obj.tmdb_api_key
     
@@ -2435,13 +2851,10 @@ def edit_holiday_channel(id):
         flash('Only administrators can access this page', 'error')
         return redirect(url_for('guide'))
     
-    from theme_service import ThemeService
-    themes = ThemeService.get_all_themes_for_user(current_user.id)
-    user_theme = current_user.theme if current_user.theme else 'plex'
-    theme_colors = themes.get(user_theme, themes.get('plex', {})).get('colors', {})
+    theme_colors = ThemeService.get_theme_colors(current_user)
     
-    db = get_session()
-    channel = db.query(HolidayChannel).filter_by(id=id).first()
+    db = ScopedSession()
+    channel = db.get(HolidayChannel, id)
     
     if not channel:
         flash('Channel not found', 'error')
@@ -2514,8 +2927,8 @@ def delete_holiday_channel(id):
         flash('Only administrators can access this page', 'error')
         return redirect(url_for('guide'))
     
-    db = get_session()
-    channel = db.query(HolidayChannel).filter_by(id=id).first()
+    db = ScopedSession()
+    channel = db.get(HolidayChannel, id)
     
     if not channel:
         flash('Channel not found', 'error')
@@ -2543,21 +2956,20 @@ def test_holiday_channel(id):
         flash('Only administrators can access this page', 'error')
         return redirect(url_for('guide'))
     
-    from theme_service import ThemeService
-    themes = ThemeService.get_all_themes_for_user(current_user.id)
-    user_theme = current_user.theme if current_user.theme else 'plex'
-    theme_colors = themes.get(user_theme, themes.get('plex', {})).get('colors', {})
+    theme_colors = ThemeService.get_theme_colors(current_user)
     
-    db = get_session()
-    channel = db.query(HolidayChannel).filter_by(id=id).first()
+    db = ScopedSession()
+    channel = db.get(HolidayChannel, id)
     
     if not channel:
         flash('Channel not found', 'error')
         return redirect(url_for('settings') + '#holiday-channels')
     
-    matching_movies = scheduler.get_movies_for_holiday_channel(channel)
+    # On this request's session, so the TMDB matching doesn't hold the scheduler's lock
+    matching_movies = scheduler.get_movies_for_holiday_channel(channel, session=db)
     
-    overrides = db.query(MovieOverride).filter_by(channel_name=channel.name).all()
+    # Every override is rendered with its movie, so fetch them all in one extra query
+    overrides = db.query(MovieOverride).options(selectinload(MovieOverride.movie)).filter_by(channel_name=channel.name).all()
     whitelist = [o for o in overrides if o.override_type == 'whitelist']
     blacklist = [o for o in overrides if o.override_type == 'blacklist']
     
@@ -2579,13 +2991,14 @@ def get_channel_overrides(id):
     if not current_user.is_admin:
         return jsonify({'error': 'Unauthorized'}), 403
     
-    db = get_session()
-    channel = db.query(HolidayChannel).filter_by(id=id).first()
+    db = ScopedSession()
+    channel = db.get(HolidayChannel, id)
     
     if not channel:
         return jsonify({'error': 'Channel not found'}), 404
     
-    overrides = db.query(MovieOverride).filter_by(channel_name=channel.name).all()
+    # Every override is rendered with its movie, so fetch them all in one extra query
+    overrides = db.query(MovieOverride).options(selectinload(MovieOverride.movie)).filter_by(channel_name=channel.name).all()
     
     result = {
         'whitelist': [],
@@ -2615,8 +3028,8 @@ def add_channel_override(id):
     if not current_user.is_admin:
         return jsonify({'error': 'Unauthorized'}), 403
     
-    db = get_session()
-    channel = db.query(HolidayChannel).filter_by(id=id).first()
+    db = ScopedSession()
+    channel = db.get(HolidayChannel, id)
     
     if not channel:
         return jsonify({'error': 'Channel not found'}), 404
@@ -2631,7 +3044,7 @@ def add_channel_override(id):
     if override_type not in ['whitelist', 'blacklist']:
         return jsonify({'error': 'Invalid override_type. Must be whitelist or blacklist'}), 400
     
-    movie = db.query(Movie).filter_by(id=movie_id).first()
+    movie = db.get(Movie, movie_id)
     if not movie:
         return jsonify({'error': 'Movie not found'}), 404
     
@@ -2674,13 +3087,13 @@ def delete_channel_override(id, override_id):
     if not current_user.is_admin:
         return jsonify({'error': 'Unauthorized'}), 403
     
-    db = get_session()
-    channel = db.query(HolidayChannel).filter_by(id=id).first()
+    db = ScopedSession()
+    channel = db.get(HolidayChannel, id)
     
     if not channel:
         return jsonify({'error': 'Channel not found'}), 404
     
-    override = db.query(MovieOverride).filter_by(
+    override = db.query(MovieOverride).options(joinedload(MovieOverride.movie)).filter_by(
         id=override_id,
         channel_name=channel.name
     ).first()
@@ -2712,8 +3125,8 @@ def search_channel_movies(id):
     if not current_user.is_admin:
         return jsonify({'error': 'Unauthorized'}), 403
     
-    db = get_session()
-    channel = db.query(HolidayChannel).filter_by(id=id).first()
+    db = ScopedSession()
+    channel = db.get(HolidayChannel, id)
     
     if not channel:
         return jsonify({'error': 'Channel not found'}), 404
@@ -2722,14 +3135,13 @@ def search_channel_movies(id):
     if not query or len(query) < 2:
         return jsonify({'movies': []})
     
-    matching_movies = scheduler.get_movies_for_holiday_channel(channel)
-    matching_movie_ids = {movie.id for movie in matching_movies}
-    
-    query_lower = query.lower()
     movies = db.query(Movie).filter(
         Movie.title.ilike(f'%{query}%')
     ).limit(50).all()
     
+    # Run the channel filter over just these hits, not the whole library (and its TMDB lookups)
+    matching_movie_ids = {movie.id for movie in scheduler.get_movies_for_holiday_channel(channel, movies, session=db)}
+    
     results = []
     for movie in movies:
         results.append({
@@ -2743,14 +3155,20 @@ def search_channel_movies(id):
     
     return jsonify({'movies': results})
 
+# Keyword candidates suggest_channel_filters pulls from a movie's title and summary,
+# minus filler words that would match almost anything
+SUGGEST_TITLE_WORD_RE = re.compile(r'\b[a-z]{4,}\b')
+SUGGEST_SUMMARY_WORD_RE = re.compile(r'\b[a-z]{5,}\b')
+SUGGEST_COMMON_WORDS = frozenset({'with', 'from', 'that', 'this', 'have', 'been', 'were', 'when', 'what', 'where', 'which', 'their', 'there'})
+
 @app.route('/admin/holiday-channels/<int:id>/suggest-filters', methods=['POST'])
 @login_required
 def suggest_channel_filters(id):
     if not current_user.is_admin:
         return jsonify({'error': 'Unauthorized'}), 403
     
-    db = get_session()
-    channel = db.query(HolidayChannel).filter_by(id=id).first()
+    db = ScopedSession()
+    channel = db.get(HolidayChannel, id)
     
     if not channel:
         return jsonify({'error': 'Channel not found'}), 404
@@ -2761,7 +3179,7 @@ def suggest_channel_filters(id):
     if not movie_id:
         return jsonify({'error': 'Missing movie_id'}), 400
     
-    movie = db.query(Movie).filter_by(id=movie_id).first()
+    movie = db.get(Movie, movie_id)
     if not movie:
         return jsonify({'error': 'Movie not found'}), 404
     
@@ -2785,10 +3203,8 @@ def suggest_channel_filters(id):
                 'label': f"Add '{genre}' to genre filter"
             })
     
-    import re
-    title_words = re.findall(r'\b[a-z]{4,}\b', movie.title.lower())
-    common_words = {'with', 'from', 'that', 'this', 'have', 'been', 'were', 'when', 'what', 'where', 'which', 'their', 'there'}
-    title_words = [w for w in title_words if w not in common_words and w not in existing_keywords]
+    title_words = SUGGEST_TITLE_WORD_RE.findall(movie.title.lower())
+    title_words = [w for w in title_words if w not in SUGGEST_COMMON_WORDS and w not in existing_keywords]
     
     for word in title_words[:3]:
         suggestions.append({
@@ -2798,8 +3214,9 @@ def suggest_channel_filters(id):
         })
     
     if movie.summary:
-        summary_words = re.findall(r'\b[a-z]{5,}\b', movie.summary.lower())
-        summary_words = [w for w in summary_words if w not in common_words and w not in existing_keywords and w not in title_words]
+        skip_words = SUGGEST_COMMON_WORDS | existing_keywords | set(title_words)
+        summary_words = SUGGEST_SUMMARY_WORD_RE.findall(movie.summary.lower())
+        summary_words = [w for w in summary_words if w not in skip_words]
         
         for word in summary_words[:2]:
             suggestions.append({
@@ -2818,8 +3235,8 @@ def apply_channel_suggestions(id):
     if not current_user.is_admin:
         return jsonify({'error': 'Unauthorized'}), 403
     
-    db = get_session()
-    channel = db.query(HolidayChannel).filter_by(id=id).first()
+    db = ScopedSession()
+    channel = db.get(HolidayChannel, id)
     
     if not channel:
         return jsonify({'error': 'Channel not found'}), 404
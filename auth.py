@@ -1,21 +1,18 @@
-import requests
 import secrets
 import logging
 from datetime import datetime
 from models import User, get_session
+from utils import http_session
 
 logger = logging.getLogger(__name__)
 
 class PlexOAuth:
     def __init__(self, client_id='popcorn-tv-scheduler'):
         self.client_id = client_id
-        self.redirect_uri = None
         self.plex_auth_url = 'https://plex.tv/api/v2/pins'
         self.plex_user_url = 'https://plex.tv/users/account.json'
     
     def get_auth_url(self, redirect_uri):
-        self.redirect_uri = redirect_uri
-        
         headers = {
             'Accept': 'application/json',
             'X-Plex-Product': 'Popcorn',
@@ -27,7 +24,7 @@ class PlexOAuth:
         }
         
         try:
-            response = requests.post(self.plex_auth_url, headers=headers, json=data)
+            response = http_session.post(self.plex_auth_url, headers=headers, json=data)
             response.raise_for_status()
             pin_data = response.json()
             
@@ -52,7 +49,7 @@ class PlexOAuth:
         }
         
         try:
-            response = requests.get(f"{self.plex_auth_url}/{pin_id}", headers=headers)
+            response = http_session.get(f"{self.plex_auth_url}/{pin_id}", headers=headers)
             response.raise_for_status()
             pin_data = response.json()
             
@@ -70,7 +67,7 @@ class PlexOAuth:
         }
         
         try:
-            response = requests.get(self.plex_user_url, headers=headers)
+            response = http_session.get(self.plex_user_url, headers=headers)
             response.raise_for_status()
             data = response.json()
             
@@ -98,7 +95,7 @@ class PlexOAuth:
         }
         
         try:
-            response = requests.get('https://plex.tv/api/v2/resources?includeHttps=1', headers=headers)
+            response = http_session.get('https://plex.tv/api/v2/resources?includeHttps=1', headers=headers)
             response.raise_for_status()
             resources = response.json()
             
@@ -136,7 +133,8 @@ def create_or_update_plex_user(user_info, auth_token, db_session):
             if existing_username:
                 username = f"{username}_{user_info['plex_id'][:8]}"
             
-            is_first_user = db_session.query(User).count() == 0
+            # LIMIT 1 probe instead of counting every user
+            is_first_user = db_session.query(User.id).first() is None
             
             user = User(
                 username=username,
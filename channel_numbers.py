@@ -1,6 +1,7 @@
 import re
 import logging
 from unidecode import unidecode
+from models import get_session, Movie, ChannelMapping
 
 logger = logging.getLogger(__name__)
 
@@ -104,6 +105,9 @@ AVAILABLE_NUMBER_RANGES = [
     (703, 799)
 ]
 
+_NON_ALNUM_RE = re.compile(r'[^a-z0-9\s]')
+_WHITESPACE_RE = re.compile(r'\s+')
+
 
 def normalize_text(text):
     """
@@ -115,11 +119,26 @@ def normalize_text(text):
     """
     text = text.lower()
     text = unidecode(text)
-    text = re.sub(r'[^a-z0-9\s]', '', text)
-    text = re.sub(r'\s+', '', text)
+    text = _NON_ALNUM_RE.sub('', text)
+    text = _WHITESPACE_RE.sub('', text)
     return text
 
 
+# Keywords are fixed, so normalize them once at import instead of on every lookup
+NORMALIZED_GENRE_KEYWORDS = [
+    (genre, keyword, normalize_text(keyword))
+    for genre, keywords in GENRE_KEYWORDS.items()
+    for keyword in keywords
+]
+
+# Reverse lookup for the fixed channel numbers
+CHANNEL_NAMES_BY_NUMBER = {number: name for name, number in CHANNEL_NUMBERS.items()}
+
+# (number, icon) by channel name. Mappings are never changed once created, so each
+# channel only needs its ChannelMapping lookups once per process
+_channel_meta_cache = {}
+
+
 def find_genre_match(channel_name):
     """
     Try to find a matching genre from CHANNEL_NUMBERS using keyword detection.
@@ -132,20 +151,18 @@ def find_genre_match(channel_name):
     """
     normalized_name = normalize_text(channel_name)
     
-    for genre, keywords in GENRE_KEYWORDS.items():
-        for keyword in keywords:
-            normalized_keyword = normalize_text(keyword)
-            if normalized_keyword in normalized_name or normalized_name in normalized_keyword:
-                if genre.capitalize() in CHANNEL_NUMBERS:
-                    base_genre = genre.capitalize()
-                elif genre == 'sci-fi' and 'Sci-Fi' in CHANNEL_NUMBERS:
-                    base_genre = 'Sci-Fi'
-                else:
-                    continue
-                    
-                base_number = CHANNEL_NUMBERS[base_genre]
-                logger.info(f"Matched '{channel_name}' to genre '{base_genre}' (keyword: {keyword})")
-                return base_genre, base_number
+    for genre, keyword, normalized_keyword in NORMALIZED_GENRE_KEYWORDS:
+        if normalized_keyword in normalized_name or normalized_name in normalized_keyword:
+            if genre.capitalize() in CHANNEL_NUMBERS:
+                base_genre = genre.capitalize()
+            elif genre == 'sci-fi' and 'Sci-Fi' in CHANNEL_NUMBERS:
+                base_genre = 'Sci-Fi'
+            else:
+                continue
+                
+            base_number = CHANNEL_NUMBERS[base_genre]
+            logger.info(f"Matched '{channel_name}' to genre '{base_genre}' (keyword: {keyword})")
+            return base_genre, base_number
     
     return None, None
 
@@ -162,13 +179,11 @@ def get_icon_for_channel(channel_name):
     """
     normalized_name = normalize_text(channel_name)
     
-    for genre, keywords in GENRE_KEYWORDS.items():
-        for keyword in keywords:
-            normalized_keyword = normalize_text(keyword)
-            if normalized_keyword in normalized_name or normalized_name in normalized_keyword:
-                icon = ICON_KEYWORDS.get(genre, 'fa-film')
-                logger.info(f"Assigned icon '{icon}' to '{channel_name}' (matched: {genre})")
-                return icon
+    for genre, keyword, normalized_keyword in NORMALIZED_GENRE_KEYWORDS:
+        if normalized_keyword in normalized_name or normalized_name in normalized_keyword:
+            icon = ICON_KEYWORDS.get(genre, 'fa-film')
+            logger.info(f"Assigned icon '{icon}' to '{channel_name}' (matched: {genre})")
+            return icon
     
     return 'fa-film'
 
@@ -268,10 +283,8 @@ def get_all_unmapped_channels():
     Returns:
         list: Channel names that need dynamic assignment
     """
+    session = get_session()
     try:
-        from models import get_session, Movie
-        
-        session = get_session()
         all_genres = session.query(Movie.genre).distinct().all()
         
         unmapped = []
@@ -285,6 +298,8 @@ def get_all_unmapped_channels():
     except Exception as e:
         logger.error(f"Error getting unmapped channels: {e}")
         return []
+    finally:
+        session.close()
 
 
 def get_channel_number(channel_name, create_if_missing=True):
@@ -304,10 +319,8 @@ def get_channel_number(channel_name, create_if_missing=True):
     if channel_name in CHANNEL_NUMBERS:
         return CHANNEL_NUMBERS[channel_name]
     
+    session = get_session()
     try:
-        from models import get_session, ChannelMapping
-        
-        session = get_session()
         mapping = session.query(ChannelMapping).filter_by(channel_name=channel_name).first()
         
         if mapping:
@@ -349,6 +362,8 @@ def get_channel_number(channel_name, create_if_missing=True):
     except Exception as e:
         logger.error(f"Error getting channel number for '{channel_name}': {e}")
         return 999
+    finally:
+        session.close()
 
 
 def get_channel_icon(channel_name):
@@ -361,10 +376,8 @@ def get_channel_icon(channel_name):
     Returns:
         str: Font Awesome icon class
     """
+    session = get_session()
     try:
-        from models import get_session, ChannelMapping
-        
-        session = get_session()
         mapping = session.query(ChannelMapping).filter_by(channel_name=channel_name).first()
         
         if mapping and mapping.icon:
@@ -375,6 +388,27 @@ def get_channel_icon(channel_name):
     except Exception as e:
         logger.error(f"Error getting icon for '{channel_name}': {e}")
         return 'fa-film'
+    finally:
+        session.close()
+
+
+def get_channel_meta(channel_name):
+    """
+    Get the channel number and icon together, cached per channel.
+    
+    Args:
+        channel_name: The channel name
+        
+    Returns:
+        tuple: (channel number, Font Awesome icon class)
+    """
+    meta = _channel_meta_cache.get(channel_name)
+    if meta is None:
+        meta = (get_channel_number(channel_name), get_channel_icon(channel_name))
+        # 999 is also the fallback on lookup errors, so don't pin it
+        if meta[0] != 999:
+            _channel_meta_cache[channel_name] = meta
+    return meta
 
 
 def format_channel_display(channel_name):
@@ -1,7 +1,10 @@
+import shutil
 import logging
+import subprocess
 from flask import request
-from models import get_session, Settings, Schedule, Movie
-from channel_numbers import get_channel_number
+from sqlalchemy.orm import joinedload
+from models import get_session, ScopedSession, Settings, Schedule, Movie
+from channel_numbers import CHANNEL_NAMES_BY_NUMBER, get_channel_meta
 from datetime import datetime, timedelta, timezone
 import xml.etree.ElementTree as ET
 
@@ -23,7 +26,7 @@ def get_server_info():
 def is_live_tv_enabled():
     """Check if Live TV integration is enabled in settings"""
     try:
-        db_session = get_session()
+        db_session = ScopedSession()
         settings = db_session.query(Settings).first()
         if settings and settings.live_tv_enabled == True:
             return True
@@ -83,7 +86,7 @@ def get_lineup(scheduler):
     
     # Use existing channel number mapping
     for channel_name in channels:
-        channel_num = get_channel_number(channel_name)
+        channel_num = get_channel_meta(channel_name)[0]
         lineup.append({
             "GuideNumber": str(channel_num),
             "GuideName": channel_name,
@@ -113,7 +116,7 @@ def generate_m3u_playlist(scheduler):
     
     # Add each channel using existing channel number mapping
     for channel_name in channels:
-        channel_num = get_channel_number(channel_name)
+        channel_num = get_channel_meta(channel_name)[0]
         # EXTINF format: duration (always -1 for live TV), tvg attributes, channel name
         m3u_content += f'#EXTINF:-1 tvg-id="{channel_num}" tvg-name="{channel_name}" tvg-chno="{channel_num}",{channel_name}\n'
         m3u_content += f'{server_info["base_url"]}/livetv/stream/{channel_num}\n'
@@ -143,7 +146,7 @@ def generate_xmltv_epg(scheduler):
     
     # Add channel definitions
     for channel_name in channels:
-        channel_num = get_channel_number(channel_name)
+        channel_num = get_channel_meta(channel_name)[0]
         channel_elem = ET.SubElement(tv, 'channel')
         channel_elem.set('id', str(channel_num))
         
@@ -155,7 +158,7 @@ def generate_xmltv_epg(scheduler):
         display_number.text = str(channel_num)
     
     # Get schedule data for the next 7 days
-    db_session = get_session()
+    db_session = ScopedSession()
     # Use timezone-aware UTC datetime
     today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
     
@@ -165,43 +168,15 @@ def generate_xmltv_epg(scheduler):
         day_of_week = current_date.weekday()  # 0 = Monday, 6 = Sunday
         
         # Get schedules for this day of week
-        schedules = db_session.query(Schedule).filter_by(day=day_of_week).all()
+        # Every programme reads its movie, so load them with the schedule rows
+        schedules = db_session.query(Schedule).options(joinedload(Schedule.movie)).filter_by(day=day_of_week).all()
         
         for schedule in schedules:
-            channel_num = get_channel_number(schedule.channel)
-            
-            # Parse start and end times (format: "HH:MM")
-            start_hour, start_min = map(int, schedule.start_time.split(':'))
-            end_hour, end_min = map(int, schedule.end_time.split(':'))
-            
-            # Handle times >= 24 (representing next day)
-            start_day_offset = 0
-            end_day_offset = 0
-            
-            if start_hour >= 24:
-                start_day_offset = start_hour // 24
-                start_hour = start_hour % 24
-            
-            if end_hour >= 24:
-                end_day_offset = end_hour // 24
-                end_hour = end_hour % 24
-            
-            # Create timezone-aware datetime objects for this specific day
-            # Use timedelta to add time components to maintain timezone
-            start_dt = current_date + timedelta(
-                days=start_day_offset,
-                hours=start_hour,
-                minutes=start_min
-            )
-            end_dt = current_date + timedelta(
-                days=end_day_offset,
-                hours=end_hour,
-                minutes=end_min
-            )
+            channel_num = get_channel_meta(schedule.channel)[0]
             
-            # Handle programs that cross midnight (if end is still before start after adjustments)
-            if end_dt <= start_dt:
-                end_dt += timedelta(days=1)
+            # Use the precomputed minute offsets instead of re-parsing "HH:MM" for every row
+            start_dt = current_date + timedelta(minutes=schedule.start_minute)
+            end_dt = start_dt + timedelta(minutes=schedule.duration_minutes)
             
             # Get movie details
             movie = schedule.movie
@@ -289,14 +264,8 @@ def get_current_program(channel_num):
     Returns:
         tuple: (movie, offset_seconds) or (None, 0) if nothing is scheduled
     """
-    from channel_numbers import CHANNEL_NUMBERS
-    
     # Find channel name from number
-    channel_name = None
-    for name, num in CHANNEL_NUMBERS.items():
-        if num == channel_num:
-            channel_name = name
-            break
+    channel_name = CHANNEL_NAMES_BY_NUMBER.get(channel_num)
     
     if not channel_name:
         logger.warning(f"No channel found for number {channel_num}")
@@ -304,36 +273,33 @@ def get_current_program(channel_num):
     
     # Get current time in UTC
     now = datetime.now(timezone.utc)
-    current_time = now.time()
     day_of_week = now.weekday()
     
     # Get schedules for this channel and day
     db_session = get_session()
-    schedules = db_session.query(Schedule).filter_by(
-        channel=channel_name,
-        day=day_of_week
-    ).all()
+    try:
+        # The caller keeps using the movie after the session is closed, so load it up front
+        schedules = db_session.query(Schedule).options(joinedload(Schedule.movie)).filter_by(
+            channel=channel_name,
+            day=day_of_week
+        ).all()
+    finally:
+        db_session.close()
     
     if not schedules:
         logger.warning(f"No schedules found for channel {channel_name} on day {day_of_week}")
         return None, 0
     
-    # Find the current program
+    # Find the current program by comparing against the precomputed minute offsets
+    seconds_today = now.hour * 3600 + now.minute * 60 + now.second
     for schedule in schedules:
-        start_hour, start_min = map(int, schedule.start_time.split(':'))
-        end_hour, end_min = map(int, schedule.end_time.split(':'))
-        
-        start_time = now.replace(hour=start_hour, minute=start_min, second=0, microsecond=0)
-        end_time = now.replace(hour=end_hour, minute=end_min, second=0, microsecond=0)
-        
-        # Handle programs that cross midnight
-        if end_time <= start_time:
-            end_time += timedelta(days=1)
+        start_seconds = schedule.start_minute * 60
+        end_seconds = start_seconds + schedule.duration_minutes * 60
         
         # Check if current time is within this program's time slot
-        if start_time <= now < end_time:
+        if start_seconds <= seconds_today < end_seconds:
             # Calculate offset in seconds from the start
-            offset = (now - start_time).total_seconds()
+            offset = seconds_today - start_seconds
             
             logger.info(f"Channel {channel_num} ({channel_name}): Playing {schedule.movie.title} at offset {offset}s")
             return schedule.movie, int(offset)
@@ -354,9 +320,6 @@ def stream_channel(channel_num, plex_api):
     Yields:
         bytes: Chunks of MPEG-TS video data
     """
-    import subprocess
-    import shutil
-    
     # Check if FFmpeg is available
     if not shutil.which('ffmpeg'):
         logger.error("FFmpeg not found on system!")
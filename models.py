@@ -1,11 +1,19 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, ForeignKey, Date, UniqueConstraint, Boolean, Text
+from sqlalchemy import create_engine, event, Column, Integer, String, Float, DateTime, ForeignKey, Date, UniqueConstraint, Boolean, Text, Index
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.orm import sessionmaker, relationship, scoped_session
+import os
+import json
+import subprocess
 from datetime import datetime
+from functools import lru_cache
 from werkzeug.security import generate_password_hash, check_password_hash
 
 Base = declarative_base()
 
+# Werkzeug hash method for new passwords, e.g. "pbkdf2:sha256:260000" to make logins cheaper
+# on small hosts. Unset keeps Werkzeug's default; existing hashes verify either way
+PASSWORD_HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD')
+
 class Movie(Base):
     __tablename__ = 'movies'
     
@@ -43,9 +51,14 @@ class Schedule(Base):
     start_time = Column(String, nullable=False)
     end_time = Column(String, nullable=False)
     day = Column(Integer, nullable=False)
+    # Minutes from midnight and slot length, precomputed so the guide doesn't parse times per render
+    start_minute = Column(Integer)
+    duration_minutes = Column(Integer)
     
     movie = relationship('Movie', back_populates='schedules')
     
+    __table_args__ = (Index('ix_schedules_channel_day', 'channel', 'day', 'start_time'),)
+    
     def __repr__(self):
         return f"<Schedule(channel='{self.channel}', start='{self.start_time}')>"
 
@@ -131,6 +144,23 @@ class Invitation(Base):
     def __repr__(self):
         return f"<Invitation(code='{self.code}', email='{self.email}')>"
 
+@lru_cache(maxsize=256)
+def decode_visible_channels(raw):
+    """Decode a visible_channels value to (names tuple, frozenset); cached across requests and users"""
+    if not raw:
+        return None, None
+    try:
+        parsed = json.loads(raw)
+    except ValueError:
+        parsed = None
+    if not isinstance(parsed, list):
+        # Unparseable or not a list (a JSON string or object would decode to characters or
+        # keys): treat as "all channels"
+        return None, None
+    # Channel names are strings; anything else in the list can't match a channel
+    names = tuple(name for name in parsed if isinstance(name, str))
+    return names, (frozenset(names) if names else None)
+
 class User(Base):
     __tablename__ = 'users'
     
@@ -160,13 +190,24 @@ class User(Base):
     using_default_password = Column(Boolean, default=False)
     
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        if PASSWORD_HASH_METHOD:
+            self.password_hash = generate_password_hash(password, method=PASSWORD_HASH_METHOD)
+        else:
+            self.password_hash = generate_password_hash(password)
     
     def check_password(self, password):
         if not self.password_hash:
             return False
         return check_password_hash(self.password_hash, password)
     
+    def password_needs_rehash(self):
+        """True when PASSWORD_HASH_METHOD is set and the stored hash was made with another method"""
+        if not PASSWORD_HASH_METHOD or not self.password_hash:
+            return False
+        # Werkzeug hashes look like "method:params$salt$hash"; a bare method name matches any params
+        stored_method = self.password_hash.split('$', 1)[0]
+        return stored_method != PASSWORD_HASH_METHOD and not stored_method.startswith(PASSWORD_HASH_METHOD + ':')
+    
     @property
     def is_authenticated(self):
         return True
@@ -178,6 +219,16 @@ class User(Base):
     def get_id(self):
         return str(self.id)
     
+    def get_visible_channels(self):
+        """Return the decoded visible_channels list (None if unset or invalid)"""
+        names = decode_visible_channels(self.visible_channels)[0]
+        return list(names) if names is not None else None
+    
+    @property
+    def visible_channels_set(self):
+        """Visible channel names as a frozenset for membership tests (None means show all)"""
+        return decode_visible_channels(self.visible_channels)[1]
+    
     def __repr__(self):
         return f"<User(username='{self.username}', email='{self.email}')>"
 
@@ -240,6 +291,8 @@ class WatchHistory(Base):
     user = relationship('User')
     movie = relationship('Movie', back_populates='watch_history')
     
+    __table_args__ = (Index('ix_watch_history_user_plex', 'user_id', 'plex_id'),)
+    
     def __repr__(self):
         return f"<WatchHistory(user_id={self.user_id}, movie='{self.movie_title}', watched_at='{self.watched_at}')>"
 
@@ -300,9 +353,6 @@ def is_volume_properly_mounted():
     Check if /data is properly mounted to a host directory (not an anonymous volume).
     Returns tuple: (is_mounted, warning_message)
     """
-    import os
-    import subprocess
-    
     data_dir = os.getenv('DATA_DIR', '.')
     
     # If not using /data, assume local development - no warning needed
@@ -328,21 +378,51 @@ def is_volume_properly_mounted():
 
 def get_db_path():
     """Get the database path from environment or use default"""
-    import os
     data_dir = os.getenv('DATA_DIR', '.')
     return os.path.join(data_dir, 'popcorn.db')
 
-def init_db(db_path=None):
+# One engine (and connection pool) per database file, shared by every session
+_engines = {}
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Per-connection SQLite tuning; run once for each new pooled connection"""
+    cursor = dbapi_connection.cursor()
+    # WAL is stored in the database file; NORMAL sync is safe under WAL and avoids an fsync per commit
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA mmap_size=268435456")  # 256MB
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA cache_size=-65536")  # 64MB
+    cursor.close()
+
+def get_engine(db_path=None):
+    """Return the shared engine for db_path, creating it on first use"""
     if db_path is None:
         db_path = get_db_path()
-    engine = create_engine(f'sqlite:///{db_path}')
+    engine = _engines.get(db_path)
+    if engine is None:
+        # Request threads, streamed posters/SSE and the background sync all hold connections, so
+        # allow more than the default 5+10; LIFO keeps reusing the same few warm connections
+        engine = create_engine(
+            f'sqlite:///{db_path}',
+            pool_size=10,
+            max_overflow=20,
+            pool_timeout=30,
+            pool_use_lifo=True
+        )
+        event.listen(engine, 'connect', set_sqlite_pragmas)
+        _engines[db_path] = engine
+    return engine
+
+def init_db(db_path=None):
+    engine = get_engine(db_path)
     Base.metadata.create_all(engine)
     Session = sessionmaker(bind=engine)
     return Session()
 
 def get_session(db_path=None):
-    if db_path is None:
-        db_path = get_db_path()
-    engine = create_engine(f'sqlite:///{db_path}')
-    Session = sessionmaker(bind=engine)
+    Session = sessionmaker(bind=get_engine(db_path))
     return Session()
+
+# Thread-local session for request handlers; removed at the end of each request
+ScopedSession = scoped_session(get_session)
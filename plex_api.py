@@ -1,7 +1,9 @@
 import os
+import time
 from plexapi.server import PlexServer
 from plexapi.exceptions import BadRequest, NotFound
 import logging
+from utils import http_session
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -19,7 +21,7 @@ class PlexAPI:
             raise ValueError("Plex URL and Token must be configured in Settings or environment variables")
 
         try:
-            self.plex = PlexServer(self.base_url, self.token)
+            self.plex = PlexServer(self.base_url, self.token, session=http_session)
             logger.info(f"Connected to Plex server: {self.plex.friendlyName}")
         except Exception as e:
             logger.error(f"Failed to connect to Plex: {e}")
@@ -196,7 +198,6 @@ class PlexAPI:
                     return False, "Playback failed. Make sure your Plex client is responding.", 0
 
                 if offset_ms > 0:
-                    import time
                     time.sleep(1)
                     try:
                         client.seekTo(int(offset_ms))
@@ -490,7 +491,7 @@ class PlexAPI:
         Returns (has_access: bool, error_message: str or None)
         """
         try:
-            user_plex = PlexServer(plex_url, user_token)
+            user_plex = PlexServer(plex_url, user_token, session=http_session)
 
             # Check if user can access any movie library
             for section in user_plex.library.sections():
@@ -2,63 +2,89 @@ from datetime import datetime, timedelta, date
 import random
 import logging
 import re
-from models import Movie, Schedule, HolidayChannel, Settings, MovieOverride, get_session
+import threading
+from functools import wraps
+from typing import NamedTuple
+from models import Movie, Schedule, HolidayChannel, Settings, MovieOverride, get_session, get_db_path
 from tmdb_api import TMDBAPI
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+class MovieSnapshot(NamedTuple):
+    """The Movie columns the guide and channel pages read, copied out of the scheduler's Session"""
+    id: int
+    plex_id: str
+    title: str
+    genre: str
+    duration: int
+    year: int
+    rating: str
+    summary: str
+    poster_url: str
+    art_url: str
+    audience_rating: float
+    content_rating: str
+    cast: str
+
+class ScheduleSlot(NamedTuple):
+    """One cached schedule entry; plain data, so views never lazy-load through the shared Session"""
+    channel: str
+    start_time: str
+    end_time: str
+    start_minute: int
+    duration_minutes: int
+    movie: MovieSnapshot
+
+# Columns selected for a ScheduleSlot: its own fields, then the MovieSnapshot fields
+SLOT_COLUMNS = [getattr(Schedule, field) for field in ScheduleSlot._fields if field != 'movie']
+MOVIE_COLUMNS = [getattr(Movie, field) for field in MovieSnapshot._fields]
+
+def with_session_lock(method):
+    """Run a ScheduleGenerator method holding its session lock (a Session isn't thread-safe)"""
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.session_lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+def with_session(method):
+    """Run a ScheduleGenerator method on the caller's session=, or on the shared session under its lock"""
+    @wraps(method)
+    def wrapper(self, *args, session=None, **kwargs):
+        if session is not None:
+            return method(self, *args, session=session, **kwargs)
+        with self.session_lock:
+            return method(self, *args, session=self.session, **kwargs)
+    return wrapper
+
 class ScheduleGenerator:
     def __init__(self, db_path=None):
-        from models import get_db_path
         if db_path is None:
             db_path = get_db_path()
+        self.db_path = db_path
         self.session = get_session(db_path)
+        # Request threads share self.session (regeneration opens its own); reentrant because
+        # the locked methods call each other
+        self.session_lock = threading.RLock()
+        # Schedule and channel lists served to views; cleared whenever schedules are regenerated
+        self.cache_version = 0
+        self._schedule_cache = {}
+        self._channels_cache = {}
         self.initialize_holiday_channels()
     
-    def migrate_holiday_channels_schema(self):
-        from sqlalchemy import inspect, text
-        inspector = inspect(self.session.bind)
-        columns = [col['name'] for col in inspector.get_columns('holiday_channels')]
-        
-        if 'genre_filter' not in columns:
-            logger.info("Migrating holiday_channels table: adding genre_filter column")
-            self.session.execute(text('ALTER TABLE holiday_channels ADD COLUMN genre_filter TEXT'))
-            self.session.commit()
-        
-        if 'filter_mode' not in columns:
-            logger.info("Migrating holiday_channels table: adding filter_mode column")
-            self.session.execute(text('ALTER TABLE holiday_channels ADD COLUMN filter_mode TEXT DEFAULT "AND"'))
-            self.session.execute(text('UPDATE holiday_channels SET filter_mode = "AND" WHERE filter_mode IS NULL'))
-            self.session.commit()
-        
-        if 'tmdb_collection_ids' not in columns:
-            logger.info("Migrating holiday_channels table: adding tmdb_collection_ids column")
-            self.session.execute(text('ALTER TABLE holiday_channels ADD COLUMN tmdb_collection_ids TEXT'))
-            self.session.commit()
-        
-        if 'tmdb_keywords' not in columns:
-            logger.info("Migrating holiday_channels table: adding tmdb_keywords column")
-            self.session.execute(text('ALTER TABLE holiday_channels ADD COLUMN tmdb_keywords TEXT'))
-            self.session.commit()
-        
-        if 'min_rating' not in columns:
-            logger.info("Migrating holiday_channels table: adding min_rating column")
-            self.session.execute(text('ALTER TABLE holiday_channels ADD COLUMN min_rating REAL'))
-            self.session.commit()
-        
-        if 'min_popularity' not in columns:
-            logger.info("Migrating holiday_channels table: adding min_popularity column")
-            self.session.execute(text('ALTER TABLE holiday_channels ADD COLUMN min_popularity REAL'))
-            self.session.commit()
+    def invalidate_cache(self):
+        """Drop cached schedules/channel lists and bump cache_version; call with session_lock held"""
+        self.cache_version += 1
+        self._schedule_cache = {}
+        self._channels_cache = {}
     
+    @with_session_lock
     def upgrade_holiday_channel_defaults(self):
         """
         Upgrade existing holiday channels with improved keywords and AND filter mode.
         This is called for existing installations to ensure they get the latest improvements.
         """
-        from sqlalchemy import text
-        
         # Define the improved channel configurations
         channel_upgrades = {
             'Cozy Halloween': {
@@ -102,11 +128,9 @@ class ScheduleGenerator:
         
         self.session.commit()
     
+    @with_session_lock
     def initialize_holiday_channels(self):
-        self.migrate_holiday_channels_schema()
-        
-        existing = self.session.query(HolidayChannel).count()
-        if existing > 0:
+        if self.session.query(HolidayChannel.id).first() is not None:
             self.upgrade_holiday_channel_defaults()
             return
         
@@ -155,9 +179,10 @@ class ScheduleGenerator:
         self.session.commit()
         logger.info("Initialized holiday channels with improved filtering")
     
-    def get_active_holiday_channels(self):
+    @with_session
+    def get_active_holiday_channels(self, session=None):
         current_month = datetime.now().month
-        holiday_channels = self.session.query(HolidayChannel).all()
+        holiday_channels = session.query(HolidayChannel).all()
         active = []
         
         for channel in holiday_channels:
@@ -170,7 +195,8 @@ class ScheduleGenerator:
         
         return active
     
-    def get_movies_for_holiday_channel(self, channel):
+    @with_session
+    def get_movies_for_holiday_channel(self, channel, movies=None, session=None):
         """
         Filter movies for a holiday channel with improved logic.
         
@@ -180,17 +206,21 @@ class ScheduleGenerator:
         3. Support filter_mode: 'AND' or 'OR'
         4. Integrate TMDB if api_key exists
         5. Return movies with detailed match reasons
+        
+        Pass `movies` to test only those candidates instead of the whole library, and
+        `session` to run the lookups on that session rather than the shared one.
         """
-        movies = self.session.query(Movie).all()
+        if movies is None:
+            movies = session.query(Movie).all()
         matching_movies = []
         
         # Get all overrides for this channel
-        overrides = self.session.query(MovieOverride).filter_by(channel_name=channel.name).all()
-        blacklist_ids = {o.movie_id for o in overrides if o.override_type == 'blacklist'}
-        whitelist_ids = {o.movie_id for o in overrides if o.override_type == 'whitelist'}
+        overrides = session.query(MovieOverride.movie_id, MovieOverride.override_type).filter_by(channel_name=channel.name).all()
+        blacklist_ids = {movie_id for movie_id, override_type in overrides if override_type == 'blacklist'}
+        whitelist_ids = {movie_id for movie_id, override_type in overrides if override_type == 'whitelist'}
         
         # Get TMDB API if available
-        settings = self.session.query(Settings).first()
+        settings = session.query(Settings).first()
         tmdb = None
         if settings and settings.tmdb_api_key:
             tmdb = TMDBAPI(settings.tmdb_api_key)
@@ -306,7 +336,8 @@ class ScheduleGenerator:
         logger.info(f"Found {len(matching_movies)} movies for holiday channel '{channel.name}' (filter_mode: {filter_mode})")
         return matching_movies
     
-    def generate_channel_schedule(self, channel_name, movies, day=0):
+    def generate_channel_schedule(self, session, channel_name, movies, day=0):
+        """Add one channel's schedule for `day` to `session`; the caller commits"""
         if not movies:
             logger.warning(f"No movies available for channel: {channel_name}")
             return
@@ -316,7 +347,7 @@ class ScheduleGenerator:
             logger.warning(f"No valid movies (duration > 0) for channel: {channel_name}")
             return
         
-        self.session.query(Schedule).filter_by(channel=channel_name, day=day).delete()
+        session.query(Schedule).filter_by(channel=channel_name, day=day).delete()
         
         random.shuffle(valid_movies)
         
@@ -345,25 +376,34 @@ class ScheduleGenerator:
                 movie_id=movie.id,
                 start_time=start_time,
                 end_time=end_time,
-                day=day
+                day=day,
+                start_minute=start_minutes,
+                duration_minutes=end_minutes - start_minutes
             )
-            self.session.add(schedule_entry)
+            session.add(schedule_entry)
             
             current_time = end_minutes
             movie_index += 1
         
-        self.session.commit()
         logger.info(f"Generated schedule for channel: {channel_name} (day {day})")
     
     def generate_all_schedules(self, force=False):
+        """
+        Rebuild every channel's schedule for all 7 days.
+        
+        The work runs on its own Session without the session lock, so views keep serving the
+        cached schedules meanwhile. All schedule writes land in one commit, and the lock is only
+        taken afterwards to drop the caches.
+        """
+        session = get_session(self.db_path)
         try:
-            settings = self.session.query(Settings).first()
+            settings = session.query(Settings).first()
             is_first_run = False
             
             if not settings:
                 settings = Settings(shuffle_frequency='weekly', last_shuffle_date=None)
-                self.session.add(settings)
-                self.session.commit()
+                session.add(settings)
+                session.commit()
                 is_first_run = True
             
             if not force and not is_first_run and settings.last_shuffle_date:
@@ -381,11 +421,9 @@ class ScheduleGenerator:
             
             logger.info("Generating fresh schedules for all channels and all 7 days")
             
-            self.session.query(Schedule).delete()
-            self.session.commit()
-            
+            # Genre schedules only need these columns
             genre_movies = {}
-            movies = self.session.query(Movie).all()
+            movies = session.query(Movie.id, Movie.genre, Movie.title, Movie.duration).all()
             
             for movie in movies:
                 if movie.genre not in genre_movies:
@@ -395,40 +433,50 @@ class ScheduleGenerator:
             channels_generated = 0
             errors_encountered = 0
             
+            # Match holiday channels (TMDB lookups included) once, before any writes, so the
+            # write transaction below stays short; the matches are the same for every day
+            holiday_movies = {}
+            try:
+                for holiday_channel in self.get_active_holiday_channels(session=session):
+                    try:
+                        holiday_movies[holiday_channel.name] = self.get_movies_for_holiday_channel(
+                            holiday_channel, session=session
+                        )
+                    except Exception as e:
+                        logger.error(f"Failed to match movies for holiday channel {holiday_channel.name}: {e}", exc_info=True)
+                        errors_encountered += 1
+            except Exception as e:
+                logger.error(f"Failed to process holiday channels: {e}", exc_info=True)
+                errors_encountered += 1
+            
+            session.query(Schedule).delete()
+            
             for day in range(7):
-                try:
-                    for genre, genre_movie_list in genre_movies.items():
-                        try:
-                            self.generate_channel_schedule(genre, genre_movie_list, day=day)
-                            channels_generated += 1
-                        except Exception as e:
-                            logger.error(f"Failed to generate schedule for {genre} on day {day}: {e}", exc_info=True)
-                            errors_encountered += 1
-                            continue
-                    
+                for genre, genre_movie_list in genre_movies.items():
                     try:
-                        active_holidays = self.get_active_holiday_channels()
-                        for holiday_channel in active_holidays:
-                            try:
-                                holiday_movies = self.get_movies_for_holiday_channel(holiday_channel)
-                                if holiday_movies:
-                                    self.generate_channel_schedule(holiday_channel.name, holiday_movies, day=day)
-                                    channels_generated += 1
-                            except Exception as e:
-                                logger.error(f"Failed to generate holiday schedule for {holiday_channel.name} on day {day}: {e}", exc_info=True)
-                                errors_encountered += 1
-                                continue
+                        self.generate_channel_schedule(session, genre, genre_movie_list, day=day)
+                        channels_generated += 1
                     except Exception as e:
-                        logger.error(f"Failed to process holiday channels for day {day}: {e}", exc_info=True)
+                        logger.error(f"Failed to generate schedule for {genre} on day {day}: {e}", exc_info=True)
                         errors_encountered += 1
+                        continue
                 
-                except Exception as e:
-                    logger.error(f"Failed to generate schedules for day {day}: {e}", exc_info=True)
-                    errors_encountered += 1
-                    continue
+                for holiday_name, movie_list in holiday_movies.items():
+                    try:
+                        if movie_list:
+                            self.generate_channel_schedule(session, holiday_name, movie_list, day=day)
+                            channels_generated += 1
+                    except Exception as e:
+                        logger.error(f"Failed to generate holiday schedule for {holiday_name} on day {day}: {e}", exc_info=True)
+                        errors_encountered += 1
+                        continue
             
             settings.last_shuffle_date = date.today()
-            self.session.commit()
+            session.commit()
+            
+            # Views see the new schedules from here on
+            with self.session_lock:
+                self.invalidate_cache()
             
             if errors_encountered > 0:
                 logger.warning(f"Schedule generation completed with {errors_encountered} errors. Generated {channels_generated} channel schedules across 7 days.")
@@ -438,41 +486,83 @@ class ScheduleGenerator:
         except Exception as e:
             logger.error(f"Critical error during schedule generation: {e}", exc_info=True)
             try:
-                self.session.rollback()
+                session.rollback()
             except Exception:
                 pass
             raise
+        finally:
+            session.close()
     
+    @with_session_lock
     def get_current_playing(self, channel):
         now = datetime.now()
-        current_time = f"{now.hour:02d}:{now.minute:02d}"
+        current_minute = now.hour * 60 + now.minute
         current_day = now.weekday()  # 0=Monday, 6=Sunday
         
-        schedules = self.session.query(Schedule).filter_by(
-            channel=channel, 
-            day=current_day
-        ).order_by(Schedule.start_time).all()
+        # Same rows the guide uses, so reuse the cached day schedule instead of querying per channel
+        schedules = self.get_channel_schedule(channel, current_day)
         
         for schedule in schedules:
-            if schedule.start_time <= current_time < schedule.end_time:
+            if schedule.start_minute <= current_minute < schedule.start_minute + schedule.duration_minutes:
                 return schedule
         
         return schedules[0] if schedules else None
     
+    def _load_slots(self, *criteria):
+        """ScheduleSlots matching criteria in airing order; call with session_lock held"""
+        rows = self.session.query(*SLOT_COLUMNS, *MOVIE_COLUMNS).join(
+            Movie, Schedule.movie_id == Movie.id
+        ).filter(*criteria).order_by(Schedule.start_time).all()
+        split = len(SLOT_COLUMNS)
+        return [ScheduleSlot(*row[:split], MovieSnapshot(*row[split:])) for row in rows]
+    
+    @with_session_lock
     def get_channel_schedule(self, channel, day=None):
         if day is None:
             day = datetime.now().weekday()  # Use current day if not specified
-        return self.session.query(Schedule).filter_by(
-            channel=channel,
-            day=day
-        ).order_by(Schedule.start_time).all()
+        key = (channel, day)
+        schedule = self._schedule_cache.get(key)
+        if schedule is None:
+            schedule = self._load_slots(Schedule.channel == channel, Schedule.day == day)
+            # /channel/<name> passes names straight from the URL; caching misses would let
+            # made-up names grow the cache without limit
+            if schedule:
+                self._schedule_cache[key] = schedule
+        return schedule
     
-    def get_all_channels(self):
-        genre_channels = self.session.query(Movie.genre).distinct().all()
-        channels = [genre[0] for genre in genre_channels]
-        
-        active_holidays = self.get_active_holiday_channels()
-        for holiday in active_holidays:
-            channels.append(holiday.name)
-        
-        return sorted(channels)
+    @with_session_lock
+    def get_day_schedules(self, channels, day):
+        """
+        (cache_version, [(channel, schedule), ...]) for several channels; any not cached yet are
+        loaded in one query. The version is read under the same lock as the rows, so callers can
+        key anything derived from them on it.
+        """
+        cache = self._schedule_cache
+        missing = [channel for channel in channels if (channel, day) not in cache]
+        if missing:
+            loaded = {channel: [] for channel in missing}
+            for slot in self._load_slots(Schedule.day == day, Schedule.channel.in_(missing)):
+                loaded[slot.channel].append(slot)
+            for channel, schedule in loaded.items():
+                cache[(channel, day)] = schedule
+        return self.cache_version, [(channel, cache[(channel, day)]) for channel in channels]
+    
+    @with_session_lock
+    def get_all_channels(self, visible=None):
+        """Sorted channel names for today, optionally limited to the names in `visible`"""
+        # Active holiday channels depend on the date, so cache per day
+        today = date.today()
+        channels = self._channels_cache.get(today)
+        if channels is None:
+            genre_channels = self.session.query(Movie.genre).distinct().all()
+            channels = [genre[0] for genre in genre_channels]
+            
+            active_holidays = self.get_active_holiday_channels()
+            for holiday in active_holidays:
+                channels.append(holiday.name)
+            
+            channels = sorted(channels)
+            self._channels_cache = {today: channels}
+        if visible:
+            return [channel for channel in channels if channel in visible]
+        return list(channels)
@@ -3,6 +3,7 @@ Theme Service - Handles theme loading, validation, and management
 """
 
 import json
+import os
 import re
 from models import CustomTheme, get_session
 from datetime import datetime
@@ -20,17 +21,40 @@ REQUIRED_COLOR_KEYS = [
 
 MAX_THEME_SIZE = 50 * 1024  # 50KB limit
 
+# get_all_themes_for_user() results by user id as (themes.json mtime, themes). Every page load
+# needs the theme colors, and custom themes only change through ThemeService (which clears
+# this), so an entry stays valid until themes.json itself is replaced
+_themes_cache = {}
+
+# themes.json contents as (mtime, themes), re-read only when the file changes
+_default_themes = None
+
+def _themes_file_mtime():
+    try:
+        return os.stat('themes.json').st_mtime_ns
+    except OSError:
+        return None
+
 class ThemeService:
     
     @staticmethod
     def load_default_themes():
         """Load default themes from themes.json"""
+        global _default_themes
+        mtime = _themes_file_mtime()
+        cached = _default_themes
+        if cached and cached[0] == mtime:
+            return dict(cached[1])
+        
         try:
             with open('themes.json', 'r') as f:
-                return json.load(f)
+                themes = json.load(f)
         except Exception as e:
             logger.error(f"Failed to load default themes: {e}")
             return {}
+        
+        _default_themes = (mtime, themes)
+        return dict(themes)
     
     @staticmethod
     def get_all_themes_for_user(user_id):
@@ -39,6 +63,23 @@ class ThemeService:
         Returns dict with theme slug as key
         Custom themes are namespaced as "custom_{user_id}_{slug}"
         """
+        return dict(ThemeService._cached_themes_for_user(user_id))
+    
+    @staticmethod
+    def get_theme_colors(user):
+        """Colors for the user's selected theme, falling back to the default 'plex' theme"""
+        # Reads the cached theme dict directly; nothing here mutates it, so skip the copy
+        themes = ThemeService._cached_themes_for_user(user.id)
+        return themes.get(user.theme or 'plex', themes.get('plex', {})).get('colors', {})
+    
+    @staticmethod
+    def _cached_themes_for_user(user_id):
+        """Shared (uncopied) theme dict for a user; callers must not modify it"""
+        mtime = _themes_file_mtime()
+        cached = _themes_cache.get(user_id)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        
         themes = ThemeService.load_default_themes()
         
         session = get_session()
@@ -61,8 +102,14 @@ class ThemeService:
         finally:
             session.close()
         
+        _themes_cache[user_id] = (mtime, themes)
         return themes
     
+    @staticmethod
+    def clear_cache():
+        """Drop cached theme lists (public custom themes are visible to every user)"""
+        _themes_cache.clear()
+    
     @staticmethod
     def validate_theme_json(theme_data_str):
         """
@@ -149,6 +196,7 @@ class ThemeService:
                 logger.info(f"Created custom theme: {slug} for user {user_id}")
             
             session.commit()
+            ThemeService.clear_cache()
             return True, None, theme
             
         except Exception as e:
@@ -176,6 +224,7 @@ class ThemeService:
             
             session.delete(theme)
             session.commit()
+            ThemeService.clear_cache()
             logger.info(f"Deleted custom theme {theme_id} for user {user_id}")
             return True, None
             
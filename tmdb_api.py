@@ -1,6 +1,7 @@
 import requests
 import logging
 from typing import Optional, Dict, List
+from utils import http_session
 
 logger = logging.getLogger(__name__)
 
@@ -19,7 +20,7 @@ class TMDBAPI:
         params['api_key'] = self.api_key
         
         try:
-            response = requests.get(f"{self.base_url}/{endpoint}", params=params, timeout=10)
+            response = http_session.get(f"{self.base_url}/{endpoint}", params=params, timeout=10)
             response.raise_for_status()
             return response.json()
         except requests.exceptions.RequestException as e:
@@ -6,17 +6,23 @@ Handles checking for updates, downloading new versions, and orchestrating the up
 import os
 import subprocess
 import shutil
-import requests
 import json
 import logging
 from datetime import datetime
 from pathlib import Path
 import importlib.util
 import sys
+import time
+from utils import http_session
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# get_latest_release() results by repo as (expires_at, release). The GitHub call can take
+# seconds and is rate limited, so repeated update checks reuse a recent answer
+RELEASE_CACHE_TTL = 600  # seconds
+_release_cache = {}
+
 class UpdateManager:
     def __init__(self, github_repo='netpersona/Popcorn', backup_dir='backups'):
         self.github_repo = github_repo
@@ -72,12 +78,16 @@ class UpdateManager:
 
     def get_latest_release(self):
         """Check GitHub for the latest release"""
+        cached = _release_cache.get(self.github_repo)
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
+        
         try:
             url = f"https://api.github.com/repos/{self.github_repo}/releases/latest"
-            response = requests.get(url, timeout=10)
+            response = http_session.get(url, timeout=10)
             response.raise_for_status()
             data = response.json()
-            return {
+            release = {
                 'tag_name': data['tag_name'],
                 'version': data['tag_name'].lstrip('v'),
                 'name': data.get('name', data['tag_name']),
@@ -85,6 +95,9 @@ class UpdateManager:
                 'published_at': data['published_at'],
                 'commit_sha': data['target_commitish']
             }
+            # Failures aren't cached so the next check retries straight away
+            _release_cache[self.github_repo] = (time.monotonic() + RELEASE_CACHE_TTL, release)
+            return release
         except Exception as e:
             logger.error(f"Failed to check for updates: {e}")
             return None
@@ -278,8 +291,11 @@ class UpdateManager:
 
             from models import MigrationHistory, get_session
             session = get_session()
-            applied = session.query(MigrationHistory).all()
-            return {m.migration_name for m in applied}
+            try:
+                applied = session.query(MigrationHistory).all()
+                return {m.migration_name for m in applied}
+            finally:
+                session.close()
         except Exception as e:
             logger.warning(f"Could not get migration history: {e}")
             return set()
@@ -290,13 +306,15 @@ class UpdateManager:
             from models import MigrationHistory, get_session
             from datetime import datetime
             session = get_session()
-
-            history = MigrationHistory(
-                migration_name=migration_name,
-                applied_at=datetime.utcnow()
-            )
-            session.add(history)
-            session.commit()
+            try:
+                history = MigrationHistory(
+                    migration_name=migration_name,
+                    applied_at=datetime.utcnow()
+                )
+                session.add(history)
+                session.commit()
+            finally:
+                session.close()
             logger.info(f"Recorded migration: {migration_name}")
         except Exception as e:
             logger.warning(f"Could not record migration {migration_name}: {e}")
@@ -379,12 +397,15 @@ class UpdateManager:
 
             from models import AppVersion, get_session
             session = get_session()
-            version_record = session.query(AppVersion).first()
-            if version_record:
-                version_record.current_commit = self.get_current_commit()
-                version_record.last_update_date = datetime.utcnow()
-                version_record.update_available = False
-                session.commit()
+            try:
+                version_record = session.query(AppVersion).first()
+                if version_record:
+                    version_record.current_commit = self.get_current_commit()
+                    version_record.last_update_date = datetime.utcnow()
+                    version_record.update_available = False
+                    session.commit()
+            finally:
+                session.close()
 
             report('Complete', 'Update successful! Restart required', 100)
             return {'success': True, 'backup_path': backup_path}
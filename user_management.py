@@ -1,6 +1,7 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
 from flask_login import login_required, current_user
 from models import get_session, User, Invitation
+from theme_service import ThemeService
 from datetime import datetime, timedelta
 import secrets
 import string
@@ -27,13 +28,7 @@ def generate_invite_code():
 @admin_required
 def list_users():
     """Display list of all users"""
-    import json
-    
-    with open('themes.json', 'r') as f:
-        themes = json.load(f)
-    
-    user_theme = current_user.theme if current_user.theme else 'plex'
-    theme_colors = themes.get(user_theme, themes['plex'])['colors']
+    theme_colors = ThemeService.get_theme_colors(current_user)
     
     db = get_session()
     try:
@@ -81,17 +76,11 @@ def create_invite():
 @admin_required
 def edit_user(user_id):
     """Edit user permissions"""
-    import json
-    
-    with open('themes.json', 'r') as f:
-        themes = json.load(f)
-    
-    user_theme = current_user.theme if current_user.theme else 'plex'
-    theme_colors = themes.get(user_theme, themes['plex'])['colors']
+    theme_colors = ThemeService.get_theme_colors(current_user)
     
     db = get_session()
     try:
-        user = db.query(User).filter_by(id=user_id).first()
+        user = db.get(User, user_id)
         if not user:
             flash('User not found.', 'error')
             return redirect(url_for('user_mgmt.list_users'))
@@ -120,7 +109,7 @@ def delete_user(user_id):
     """Delete a user"""
     db = get_session()
     try:
-        user = db.query(User).filter_by(id=user_id).first()
+        user = db.get(User, user_id)
         if not user:
             flash('User not found.', 'error')
             return redirect(url_for('user_mgmt.list_users'))
@@ -160,7 +149,7 @@ def delete_invitation(invite_id):
     """Delete an invitation"""
     db = get_session()
     try:
-        invitation = db.query(Invitation).filter_by(id=invite_id).first()
+        invitation = db.get(Invitation, invite_id)
         if not invitation:
             flash('Invitation not found.', 'error')
             return redirect(url_for('user_mgmt.list_invitations'))
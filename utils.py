@@ -1,11 +1,22 @@
 """
 Utility functions for Popcorn
 """
+import os
 import shutil
 import logging
+from pathlib import Path
+import requests
+from requests.adapters import HTTPAdapter
 
 logger = logging.getLogger(__name__)
 
+# Shared HTTP session so Plex API calls and poster fetches reuse keep-alive connections
+http_session = requests.Session()
+# pool_maxsize covers the 16 poster prefetch workers plus concurrent request threads
+_http_adapter = HTTPAdapter(pool_connections=16, pool_maxsize=50, max_retries=1)
+http_session.mount('http://', _http_adapter)
+http_session.mount('https://', _http_adapter)
+
 
 def check_ffmpeg_available():
     """
@@ -14,9 +25,6 @@ def check_ffmpeg_available():
     Returns:
         tuple: (is_available: bool, message: str)
     """
-    import os
-    from pathlib import Path
-    
     # First check system PATH (includes /data/ffmpeg/bin if entrypoint.sh added it)
     ffmpeg_path = shutil.which('ffmpeg')
     
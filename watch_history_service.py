@@ -1,12 +1,15 @@
-from models import WatchHistory, Movie, get_session
+from models import WatchHistory, Movie, ScopedSession
 from sqlalchemy import func, desc
 from datetime import datetime, timedelta
 from collections import Counter
 
+# Keep IN (...) lists under SQLite's bound-variable limit
+IN_BATCH_SIZE = 500
+
 class WatchHistoryService:
     @staticmethod
     def get_user_stats(user_id):
-        session = get_session()
+        session = ScopedSession()
         
         total_movies = session.query(func.count(WatchHistory.id)).filter(
             WatchHistory.user_id == user_id
@@ -82,7 +85,7 @@ class WatchHistoryService:
     
     @staticmethod
     def has_watched(user_id, plex_id):
-        session = get_session()
+        session = ScopedSession()
         return session.query(WatchHistory).filter(
             WatchHistory.user_id == user_id,
             WatchHistory.plex_id == plex_id
@@ -90,7 +93,7 @@ class WatchHistoryService:
     
     @staticmethod
     def get_watch_count(user_id, plex_id):
-        session = get_session()
+        session = ScopedSession()
         return session.query(func.count(WatchHistory.id)).filter(
             WatchHistory.user_id == user_id,
             WatchHistory.plex_id == plex_id
@@ -98,7 +101,7 @@ class WatchHistoryService:
     
     @staticmethod
     def get_progress(user_id, plex_id):
-        session = get_session()
+        session = ScopedSession()
         latest_watch = session.query(WatchHistory).filter(
             WatchHistory.user_id == user_id,
             WatchHistory.plex_id == plex_id
@@ -108,9 +111,27 @@ class WatchHistoryService:
             return latest_watch.playback_position
         return 0
     
+    @staticmethod
+    def bulk_watch_state(user_id, plex_ids):
+        """Bulk has_watched() + get_progress() in one query per IN_BATCH_SIZE ids.
+        Returns (set of watched plex_ids, dict of plex_id -> latest playback position for ids with progress)"""
+        session = ScopedSession()
+        latest_position = {}
+        plex_ids = list(set(plex_ids))
+        for i in range(0, len(plex_ids), IN_BATCH_SIZE):
+            rows = session.query(WatchHistory.plex_id, WatchHistory.playback_position).filter(
+                WatchHistory.user_id == user_id,
+                WatchHistory.plex_id.in_(plex_ids[i:i + IN_BATCH_SIZE])
+            ).order_by(WatchHistory.watched_at)
+            # Rows come oldest first, so the latest watch of each movie wins
+            for plex_id, position in rows:
+                latest_position[plex_id] = position
+        progress = {plex_id: position for plex_id, position in latest_position.items() if position and position > 0}
+        return set(latest_position), progress
+    
     @staticmethod
     def get_continue_watching(user_id, limit=10):
-        session = get_session()
+        session = ScopedSession()
         
         # Get movies with watch history and progress
         recent_watches = session.query(